@@ -1,11 +1,317 @@
 # analisator.py
-import pyaudio
 import numpy as np
 import threading
 import time
 
+from chord_detector import ChordDetector
+from instrumentation import Instrumentation
+from note_detecter import PITCH_CLASSES
+from onset_detector import OnsetDetector
+from pitch_engines import autocorrelation_terms, create_estimator
+
+
+def _peak_level(x):
+    """max(|x|) без временного массива np.abs(x)."""
+    if x.size == 0:
+        return 0.0
+    return max(float(x.max()), -float(x.min()))
+
+
+def _wave_chunks(wf, chunk_size):
+    """Читает PCM WAV кусками и отдаёт float32 (frames, channels) в диапазоне -1..1."""
+    try:
+        channels = wf.getnchannels()
+        width = wf.getsampwidth()
+        while True:
+            raw = wf.readframes(chunk_size)
+            if not raw:
+                break
+
+            if width == 1:
+                x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+            elif width == 2:
+                x = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+            elif width == 3:
+                b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+                v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+                v = np.where(v >= 1 << 23, v - (1 << 24), v)
+                x = v.astype(np.float32) / float(1 << 23)
+            elif width == 4:
+                x = np.frombuffer(raw, dtype="<i4").astype(np.float32) / float(1 << 31)
+            else:
+                raise RuntimeError(f"Неподдерживаемая разрядность WAV: {8 * width} бит")
+
+            yield x.reshape(-1, channels)
+    finally:
+        wf.close()
+
+
+class CaptureRing:
+    """
+    Кольцевой буфер "callback -> поток анализа" без блокировок.
+    Пишет только аудио-callback, читает только поток анализа:
+    писатель сначала кладёт сэмплы, потом сдвигает счётчик written,
+    поэтому читатель никогда не видит "недописанные" данные.
+
+    Буфер "зеркальный" (двойной длины): каждый сэмпл лежит и в [pos], и в [pos + capacity],
+    поэтому любое окно до capacity сэмплов — это непрерывный срез, без копирования.
+    """
+
+    def __init__(self, capacity):
+        import numpy as np
+
+        self.capacity = int(capacity)
+        self._buf = np.zeros(2 * self.capacity, dtype=np.float32)
+        # сколько сэмплов записано за всё время (монотонно растёт)
+        self.written = 0
+
+    def write(self, x):
+        n = int(x.shape[0])
+        if n == 0:
+            return
+
+        cap = self.capacity
+        start = self.written
+        if n > cap:
+            # если пришло больше, чем помещается — нужен только хвост
+            start += n - cap
+            x = x[-cap:]
+
+        m = int(x.shape[0])
+        pos = start % cap
+        first = min(m, cap - pos)
+        buf = self._buf
+        buf[pos:pos + first] = x[:first]
+        buf[cap + pos:cap + pos + first] = x[:first]
+        if first < m:
+            buf[:m - first] = x[first:]
+            buf[cap:cap + m - first] = x[first:]
+
+        self.written += n
+
+    def view(self, end, n):
+        """
+        Окно из n сэмплов, заканчивающееся на абсолютной позиции end, как read-only срез буфера.
+        Там, где данных ещё не было (начало записи) — нули.
+        Данные не копируются: после использования проверьте valid(end - n).
+        """
+        start = (end - n) % self.capacity
+        v = self._buf[start:start + n]
+        v.flags.writeable = False
+        return v
+
+    def valid(self, start):
+        """True, если сэмплы начиная с абсолютной позиции start ещё не перезаписаны."""
+        return self.written - self.capacity <= start
+
+
+class FrameSpectrum:
+    """
+    Спектр одного кадра анализа.
+    Окно Ханна + rfft считаются один раз (лениво, при первом запросе),
+    дальше все спектральные проверки кадра (уточнение, гармоники) берут готовые массивы.
+    """
+
+    # меньше этого окна спектру не доверяем (слишком грубые бины)
+    MIN_SIZE = 2048
+
+    # (n, sr) -> (окно Ханна, частоты бинов): таблицы общие для всех кадров одного размера
+    _tables = {}
+
+    @classmethod
+    def tables(cls, n, sr):
+        import numpy as np
+
+        key = (int(n), int(sr))
+        t = cls._tables.get(key)
+        if t is None:
+            window = np.hanning(key[0]).astype(np.float32)
+            freqs = np.fft.rfftfreq(key[0], 1.0 / key[1])
+            window.setflags(write=False)
+            freqs.setflags(write=False)
+            t = (window, freqs)
+            cls._tables[key] = t
+        return t
+
+    def __init__(self, samples, sr):
+        self.samples = samples
+        self.sr = int(sr)
+        self.n = int(samples.size)
+        self._window, self._freqs = self.tables(self.n, self.sr)
+        self._mags = None
+        # для CQT: rfft кадра без окна (у ядер CQT свои окна) и модули по ядрам
+        self._rfft = None
+        self._cq = {}
+
+    def _compute(self):
+        import numpy as np
+
+        x = np.asarray(self.samples, dtype=np.float32)
+        xw = x - float(np.mean(x))
+        xw *= self._window
+        self._mags = np.abs(np.fft.rfft(xw))
+
+    @property
+    def mags(self):
+        if self._mags is None:
+            self._compute()
+        return self._mags
+
+    @property
+    def freqs(self):
+        return self._freqs
+
+    def constant_q(self, bins_per_octave=36, fmin=65.0, fmax=4200.0, a4=440.0):
+        """
+        Модули constant-Q спектра кадра (constant_q.ConstantQKernel) и само ядро (частоты бинов — kernel.freqs).
+        Бины по нотам, ядро общее для всех кадров того же размера; на кадр — rfft + sparse-умножение.
+        """
+        import numpy as np
+        from constant_q import constant_q_kernel
+
+        kernel = constant_q_kernel(self.sr, self.n, bins_per_octave, fmin, fmax, a4)
+        cq = self._cq.get(kernel)
+        if cq is None:
+            if self._rfft is None:
+                x = np.asarray(self.samples, dtype=np.float32)
+                self._rfft = np.fft.rfft(x - float(np.mean(x)))
+            cq = self._cq[kernel] = kernel.magnitudes(self._rfft)
+        return cq, kernel
+
+    def band(self, lo, hi):
+        """
+        Диапазон бинов [k_lo, k_hi) с частотами в полосе [lo, hi] Гц (может быть пустым).
+        Считается напрямую по шагу бина, без маски по всему спектру.
+        """
+        import math
+
+        freqs = self._freqs
+        last = freqs.size - 1
+        step = float(self.sr) / float(self.n)
+
+        k_lo = min(max(int(math.ceil(lo / step)), 0), last + 1)
+        while k_lo > 0 and freqs[k_lo - 1] >= lo:
+            k_lo -= 1
+        while k_lo <= last and freqs[k_lo] < lo:
+            k_lo += 1
+
+        k_hi = min(max(int(math.floor(hi / step)), -1), last)
+        while k_hi < last and freqs[k_hi + 1] <= hi:
+            k_hi += 1
+        while k_hi >= 0 and freqs[k_hi] > hi:
+            k_hi -= 1
+
+        return k_lo, max(k_lo, k_hi + 1)
+
+    def peak_at(self, target_freq, bandwidth=8.0):
+        """Максимальная амплитуда в окне [target_freq-bandwidth, target_freq+bandwidth]."""
+        import numpy as np
+
+        f = float(target_freq)
+        if f <= 0 or self.n < self.MIN_SIZE:
+            return 0.0
+
+        k_lo, k_hi = self.band(max(0.0, f - float(bandwidth)), f + float(bandwidth))
+        if k_hi <= k_lo:
+            return 0.0
+
+        return float(np.max(self.mags[k_lo:k_hi]))
+
+    def refine_near(self, center_freq, bandwidth=40.0):
+        """Частота пика рядом с center_freq с параболической интерполяцией по спектру."""
+        import numpy as np
+
+        if self.n < self.MIN_SIZE or center_freq <= 0:
+            return 0.0
+
+        k_lo, k_hi = self.band(max(0.0, center_freq - bandwidth), center_freq + bandwidth)
+        if k_hi <= k_lo:
+            return 0.0
+
+        mags = self.mags
+        freqs = self._freqs
+
+        k = k_lo + int(np.argmax(mags[k_lo:k_hi]))
+        f0 = float(freqs[k])
+
+        # параболическая интерполяция по спектру (если возможно)
+        if 1 <= k < len(mags) - 1:
+            a, b, c = float(mags[k - 1]), float(mags[k]), float(mags[k + 1])
+            denom = (a - 2 * b + c)
+            if abs(denom) > 1e-12:
+                delta = 0.5 * (a - c) / denom
+                f0 = float(freqs[k] + delta * (freqs[1] - freqs[0]))
+
+        return f0
+
+
+class PitchResult:
+    """
+    Результат одного шага анализа (неизменяемый по смыслу: после публикации не меняется).
+    frequency     — опубликованная частота после стабилизации/гистерезиса (0.0 — ноты нет),
+    raw_frequency — оценка движка на этом кадре до стабилизации,
+    confidence    — уверенность движка (для YIN: 1 - CMNDF в минимуме),
+    rms, peak     — уровень свежей части окна (последний hop),
+    timestamp     — время захвата последнего сэмпла окна по time.perf_counter
+                    (офлайн — секунды от начала записи),
+    sample        — абсолютная позиция конца окна в потоке, frame — номер кадра,
+    stable        — частота подтверждена гистерезисом на этом кадре.
+    """
+
+    __slots__ = ("frequency", "raw_frequency", "confidence", "rms", "peak",
+                 "timestamp", "sample", "frame", "stable")
+
+    def __init__(self, frequency=0.0, raw_frequency=0.0, confidence=0.0, rms=0.0, peak=0.0,
+                 timestamp=0.0, sample=0, frame=0, stable=False):
+        self.frequency = float(frequency)
+        self.raw_frequency = float(raw_frequency)
+        self.confidence = float(confidence)
+        self.rms = float(rms)
+        self.peak = float(peak)
+        self.timestamp = float(timestamp)
+        self.sample = int(sample)
+        self.frame = int(frame)
+        self.stable = bool(stable)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return (f"PitchResult(frequency={self.frequency:.2f}, confidence={self.confidence:.2f}, "
+                f"rms={self.rms:.4f}, frame={self.frame}, stable={self.stable})")
+
+
+class NoteEvent:
+    """
+    Начало или конец ноты (см. Analisador.subscribe_events).
+    kind      — "on" (высота новой ноты подтверждена) или "off" (нота кончилась: тишина или новая атака),
+    frequency — частота ноты (у "off" — той, что кончилась),
+    sample    — абсолютная позиция сэмпла события (у "on" — первый сэмпл атаки),
+    timestamp — время захвата этого сэмпла по time.perf_counter (офлайн — секунды от начала записи),
+    strength  — сила атаки (поток / порог OnsetDetector), 0.0 — нота началась без атаки (легато).
+    """
+
+    __slots__ = ("kind", "frequency", "sample", "timestamp", "strength")
+
+    def __init__(self, kind, frequency, sample, timestamp, strength=0.0):
+        self.kind = str(kind)
+        self.frequency = float(frequency)
+        self.sample = int(sample)
+        self.timestamp = float(timestamp)
+        self.strength = float(strength)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return (f"NoteEvent({self.kind}, frequency={self.frequency:.2f}, sample={self.sample}, "
+                f"timestamp={self.timestamp:.4f}, strength={self.strength:.1f})")
+
+
 class Analisador:
-    def __init__(self, device=None, channel_index=0, volume_threshold=0.02, sample_rate=None, blocksize=4096):
+    def __init__(self, device=None, channel_index=0, volume_threshold=0.02, sample_rate=None, blocksize=None,
+                 hop_size=None, low_latency=False, low_band=False, engine="yin", chords=False, onsets=True,
+                 channels=None):
         import threading
 
         self.device = device
@@ -14,51 +320,171 @@ class Analisador:
 
         self.sample_rate = int(sample_rate) if sample_rate else None
 
-        # Блок побольше для стабильности
-        self.blocksize = int(blocksize) if blocksize else 4096
+        # Режим "сцена": маленькие блоки, latency='low', короткие окна.
+        # По умолчанию — прежний стабильный режим с большими блоками.
+        self.low_latency = bool(low_latency)
+
+        # Блок побольше для стабильности (в low_latency — маленький блок).
+        # Заданный явно блок смена режима в reconfigure не трогает
+        self._blocksize_auto = not blocksize
+        self.blocksize = int(blocksize) if blocksize else self._mode_blocksize()
+
+        # Шаг анализа (сэмплов между соседними окнами), не зависит от blocksize устройства.
+        # None -> один анализ на блок, как раньше. 256/512/1024 — чаще обновления, больше CPU.
+        self.hop_size = int(hop_size) if hop_size else None
 
         self._frequency = 0.0
         self._lock = threading.Lock()
 
+        # Подписчики на новые результаты (см. subscribe): кортеж, заменяется целиком,
+        # поэтому поток анализа перебирает его без блокировки
+        self._subscribers = ()
+
+        # Последний результат и история последних history_size результатов (PitchResult).
+        # История — кортеж, который заменяется целиком: читатели (UI, игра) берут ссылку без блокировки.
+        self.history_size = 64
+        self._result = PitchResult()
+        self._history = ()
+        self._frame_index = 0
+        self._frame_end = 0
+        self._frame_level = (0.0, 0.0)
+
         self._stream = None
         self._running = False
         self._stream_lock = threading.Lock()
 
+        # Трекеры дополнительных входов того же потока (см. set_channels): кортеж, заменяется целиком
+        self._channel_trackers = ()
+
         # Стабилизация/кандидаты
         self._candidate_note_freq = 0.0
         self._candidate_hits = 0
 
+        # Параметры устойчивости: делаем мягче, чтобы "ожило"
+        self.conf_min_low = 0.45
+        self.conf_min_high = 0.55
+        self.split_high_hz = 350.0
+        # Диапазон поиска основного тона
+        self.fmin = 70.0
+        self.fmax = 1200.0
+        # Прореженный путь для низких нот (drop-строи, 7-струнные, баритон).
+        # С ним нижняя граница опускается до B0 (~31 Гц).
+        self.low_band = bool(low_band)
+        self.low_band_factor = 4
+        # порог нормированной разности на половине лага (см. _octave_up_check) и до какой частоты
+        # её проверять на полной частоте: ниже обычного fmin оценка появляется только в low_band
+        self.low_band_octave_check = 0.1
+        self.low_band_check_below_hz = 70.0
+        # прореженный путь — только когда полноскоростной YIN уже подтвердил ноту ниже ~60 Гц (B1 и ниже):
+        # на обычных струнах прореженный YIN чаще ошибается на октаву вниз
+        self.low_band_split_hz = 60.0
+        self._decim_filters = {}
+        if self.low_band:
+            self.fmin = 30.0
+
+        # Движок определения высоты (pitch_engines): yin / mpm / hps / cepstrum
+        self.engine = "yin"
+        self._estimator = None
+        self.set_engine(engine)
+
+        # Сколько периодов фундамента держать в окне анализа (см. _choose_window)
+        self.window_periods = 14.0
+        # FFT-уточнение только если бин не шире этого (8192 @ 48kHz = 5.9 Гц, 2048 = 23 Гц)
+        self.refine_max_bin_hz = 12.0
+
+        # Частота дискретизации открытого потока (для статистики)
+        self._stream_sr = None
+
+        # Последняя оценка движка до стабилизации: (freq, confidence)
+        self._last_estimate = (0.0, 0.0)
+
+        # Спектр текущего кадра (один FFT на кадр, см. _frame_spectrum)
+        self._spectrum = None
+
+        # Аккорды (ChordDetector) по тому же кольцу захвата — по умолчанию выключено, см. set_chords
+        self.chords = bool(chords)
+        self._chord_detector = None
+        self._chord = None
+
+        # Уровни нот для экрана тюнера (constant-Q, бин = полутон) — по умолчанию выключено, см. set_note_levels.
+        # Окно фиксированной длины: ядро CQT строится один раз на размер (см. _prepare_kernels)
+        self.note_levels = False
+        self.note_levels_size = 8192
+        self.note_levels_range = (70.0, 1400.0)
+        self._note_levels = ()
+
+        # Атаки (OnsetDetector) и события нот "on"/"off" (NoteEvent, см. subscribe_events).
+        # На каждой атаке стабилизация и гистерезис начинаются заново — старая нота не тянет новую.
+        self.onsets = bool(onsets)
+        self._onset_detector = None
+        self._event_subscribers = ()
+        self._events = ()
+        self._note_on = None        # NoteEvent звучащей ноты
+        self._onset_pending = None  # (sample, strength) атаки, чья высота ещё не подтверждена
+        self._legato_pending = None  # (частота, сэмпл) смены ноты без атаки, ждущей подтверждения
+        self._onset_sample = None   # последняя атака, пока окно анализа захватывает звук до неё
+        self._settling = False
+        # после атаки высоту ищем по окну не короче этого (сэмплов), только по звуку новой ноты
+        self.onset_min_window = 2048
+
+        # Поток анализа (callback только складывает сэмплы в кольцо)
+        self._worker = None
+        self._worker_stop = None
+
+        # Счётчики захвата: по ним видно, есть ли потери звука
+        self._stats = {
+            "callbacks": 0,
+            "input_overflows": 0,   # PortAudio не успел отдать данные (переполнение входа)
+            "input_underflows": 0,
+            "ring_overruns": 0,     # анализ отстал, и callback перезаписал непрочитанное
+            "hops_skipped": 0,      # анализ отстал и пропустил шаги, чтобы догнать
+            "frames_analyzed": 0,
+            "analysis_ms_avg": 0.0,  # цена одного шага анализа (скользящее среднее)
+            "analysis_ms_max": 0.0,
+            "latency_ms_last": 0.0,  # от захвата последнего сэмпла окна до готового результата
+            "latency_ms_avg": 0.0,
+            "latency_ms_max": 0.0,
+        }
+
+        # (сколько сэмплов записано, время захвата последнего из них по time.perf_counter)
+        self._capture_stamp = (0, 0.0)
+
+        # Тайминги стадий (гистограммы), счётчики отброшенных кадров, исключения, флаги PortAudio.
+        # См. get_instrumentation(); instrumentation.enabled = False отключает только тайминги.
+        self.instrumentation = Instrumentation()
+
         self._init_buffers()
 
+        # Одновременный анализ нескольких входов одного устройства (гексафонический звукосниматель —
+        # вход на струну, многоканальная карта на всю группу): у каждого входа своё кольцо и свой трекер.
+        if channels is not None:
+            self._channel_trackers = self._make_channel_trackers(channels)
+
+    def set_engine(self, name):
+        """Переключить движок определения высоты (можно на ходу, со следующего кадра), и у трекеров входов."""
+        estimator = create_estimator(name, yin_detect=self._detect_pitch_yin)
+        self.engine = estimator.name
+        self._estimator = estimator
+        for tracker in self._channel_trackers:
+            tracker.set_engine(name)
+
+    def _frame_spectrum(self, mono, sr):
+        """
+        Спектр текущего кадра: внутри _analyze_window он один на все запросы.
+        Для "чужого" массива (вызов вне конвейера) считаем отдельный.
+        """
+        spec = self._spectrum
+        if spec is not None and spec.samples is mono and spec.sr == int(sr):
+            return spec
+        return FrameSpectrum(mono, sr)
+
     def _fft_peak_at(self, mono, sr, target_freq, bandwidth=8.0):
         """
         Возвращает максимальную амплитуду FFT в окне [target_freq-bandwidth, target_freq+bandwidth].
-        mono: np.float32
+        mono: np.float32 или FrameSpectrum
         """
-        import numpy as np
-
-        f = float(target_freq)
-        if f <= 0:
-            return 0.0
-
-        x = mono.astype(np.float32)
-        n = x.size
-        if n < 2048:
-            return 0.0
-
-        x = x - float(np.mean(x))
-        xw = x * np.hanning(n)
-        spec = np.fft.rfft(xw)
-        mags = np.abs(spec)
-        freqs = np.fft.rfftfreq(n, 1.0 / sr)
-
-        lo = max(0.0, f - float(bandwidth))
-        hi = f + float(bandwidth)
-        mask = (freqs >= lo) & (freqs <= hi)
-        if not np.any(mask):
-            return 0.0
-
-        return float(np.max(mags[mask]))
+        spec = mono if isinstance(mono, FrameSpectrum) else self._frame_spectrum(mono, sr)
+        return spec.peak_at(target_freq, bandwidth)
 
     def _octave_correct_by_harmonics(self, mono, sr, f_candidate, fmin=70.0, fmax=1200.0):
         """
@@ -86,11 +512,14 @@ class Analisador:
         if not cands:
             return f
 
+        # один спектр на все кандидаты и гармоники
+        spec = self._frame_spectrum(mono, sr)
+
         def score(freq):
             # Смотрим пик на freq и на 2*freq (гармоника)
-            p1 = self._fft_peak_at(mono, sr, freq, bandwidth=10.0)
-            p2 = self._fft_peak_at(mono, sr, freq * 2.0, bandwidth=10.0) if freq * 2.0 <= fmax else 0.0
-            p3 = self._fft_peak_at(mono, sr, freq * 3.0, bandwidth=12.0) if freq * 3.0 <= fmax else 0.0
+            p1 = self._fft_peak_at(spec, sr, freq, bandwidth=10.0)
+            p2 = self._fft_peak_at(spec, sr, freq * 2.0, bandwidth=10.0) if freq * 2.0 <= fmax else 0.0
+            p3 = self._fft_peak_at(spec, sr, freq * 3.0, bandwidth=12.0) if freq * 3.0 <= fmax else 0.0
 
             # У фундамента обычно есть и гармоники, но не должно быть так,
             # чтобы "фундамент" был слабым, а гармоники сильнее в разы.
@@ -108,98 +537,79 @@ class Analisador:
 
         return float(best_f)
 
-    def _get_ring_window(self):
-        import numpy as np
-
+    def _get_ring_window(self, end):
         # Достаточно, чтобы накопилось хотя бы 75% окна
-        if not self._ring_filled and self._ring_pos < int(self._analysis_window * 0.75):
+        if end < int(self._analysis_window * 0.75):
             return None
 
-        w = self._analysis_window
-        pos = self._ring_pos
-
-        if pos == 0:
-            return self._ring.copy()
+        start = end - self._analysis_window
+        if not self._ring.valid(start):
+            self._stats["ring_overruns"] += 1
+            self.instrumentation.count("frames_dropped")
+            return None
 
-        return np.concatenate((self._ring[pos:], self._ring[:pos])).astype(np.float32)
+        # срез кольца без копирования: анализ идёт прямо по нему
+        return self._ring.view(end, self._analysis_window)
 
     def _push_ring(self, mono):
-        import numpy as np
+        # вызывается из audio callback: только копирование, без анализа
+        t0 = time.perf_counter()
+        self._ring.write(mono)
+        self.instrumentation.record("ring_push", time.perf_counter() - t0)
 
-        x = mono.astype(np.float32)
-        n = x.size
-        if n == 0:
-            return
-
-        # пишем в кольцо
-        w = self._analysis_window
-        pos = self._ring_pos
-
-        if n >= w:
-            # если пришло больше окна — берём хвост
-            self._ring[:] = x[-w:]
-            self._ring_pos = 0
-            self._ring_filled = True
-            return
-
-        end = pos + n
-        if end < w:
-            self._ring[pos:end] = x
-            self._ring_pos = end
-        else:
-            first = w - pos
-            self._ring[pos:] = x[:first]
-            rest = n - first
-            self._ring[:rest] = x[first:]
-            self._ring_pos = rest
-            self._ring_filled = True
+    def _mode_blocksize(self):
+        return 256 if self.low_latency else 4096
 
     def _refine_fft_near(self, mono, sr, center_freq, bandwidth=40.0):
-        import numpy as np
-
-        x = mono.astype(np.float32)
-        n = x.size
-        if n < 2048 or center_freq <= 0:
-            return 0.0
-
-        # окно + FFT
-        x = x - float(np.mean(x))
-        xw = x * np.hanning(n)
-        fft = np.fft.rfft(xw)
-        mags = np.abs(fft)
-        freqs = np.fft.rfftfreq(n, 1.0 / sr)
-
-        lo = max(0.0, center_freq - bandwidth)
-        hi = center_freq + bandwidth
-
-        mask = (freqs >= lo) & (freqs <= hi)
-        if not np.any(mask):
-            return 0.0
+        return self._frame_spectrum(mono, sr).refine_near(center_freq, bandwidth)
 
-        idx = int(np.argmax(mags[mask]))
-        f0 = float(freqs[mask][idx])
+    def _init_buffers(self):
+        # Окно подбирается по высоте ноты (см. _choose_window):
+        # верхам хватает 4096, низам (drop-строи) нужно до 16384.
+        # Пока ноты нет — 8192, как раньше: быстро "оживает" и держит весь диапазон при 48kHz.
+        # В low_latency всё короче: 2048..4096.
+        if self.low_latency:
+            self._window_min, self._window_default, self._window_max = 2048, 4096, 4096
+        else:
+            self._window_min, self._window_default, self._window_max = 4096, 8192, 16384
+        self._analysis_window = self._window_default
+        self._window_smooth = float(self._window_default)
+        # Запас по ёмкости, чтобы callback не перезаписал окно, пока его анализируют.
+        # Окно аккордов длиннее окна высоты — место под него есть всегда, чтобы set_chords работал на ходу.
+        capacity = max(2 * self._window_max, self._window_max + 8 * int(self.blocksize),
+                       ChordDetector.MAX_WINDOW + 8 * int(self.blocksize))
+        self._ring = CaptureRing(capacity)
+        self._ring_read_end = 0
+        self._capture_stamp = (0, 0.0)
+
+    def _choose_window(self, sr):
+        """
+        Длина окна для следующего кадра по текущей оценке высоты:
+        ~window_periods периодов фундамента, в пределах [_window_min, _window_max].
+        Меняется плавно (сглаживание в лог-шкале) и шагами по 1024,
+        чтобы кэш таблиц FFT не разрастался.
+        """
+        import math
 
-        # параболическая интерполяция по спектру (если возможно)
-        masked_idxs = np.where(mask)[0]
-        k = masked_idxs[idx]
-        if 1 <= k < len(mags) - 1:
-            a, b, c = float(mags[k - 1]), float(mags[k]), float(mags[k + 1])
-            denom = (a - 2 * b + c)
-            if abs(denom) > 1e-12:
-                delta = 0.5 * (a - c) / denom
-                f0 = float(freqs[k] + delta * (freqs[1] - freqs[0]))
+        f = float(self._candidate_note_freq)
+        if f > 0:
+            desired = self.window_periods * sr / f
+        else:
+            desired = float(self._window_default)
 
-        return f0
+        # YIN видит лаги только до n/2: самая низкая нота должна помещаться всегда
+        desired = max(desired, self._window_min, 2.2 * sr / self.fmin)
+        desired = min(desired, self._window_max)
 
-    def _init_buffers(self):
-        import numpy as np
+        # растём быстро (пришла низкая нота), сжимаемся медленно
+        cur = self._window_smooth
+        alpha = 0.5 if desired > cur else 0.15
+        cur = cur * (desired / cur) ** alpha
+        self._window_smooth = cur
 
-        # Для точности достаточно 8192..16384.
-        # 8192 быстрее "оживает" и стабильно работает на верхах при 48kHz.
-        self._analysis_window = 8192
-        self._ring = np.zeros(self._analysis_window, dtype=np.float32)
-        self._ring_pos = 0
-        self._ring_filled = False
+        step = 1024
+        n = int(math.ceil(cur / step - 1e-9)) * step
+        return min(max(n, self._window_min), self._window_max)
 
     def start(self):
         with self._stream_lock:
@@ -219,7 +629,7 @@ class Analisador:
 
         # Открываем только столько каналов, сколько реально нужно:
         # если пользователь выбрал Input 2 (channel_index=1), нужно минимум 2 канала
-        need_channels = min(max_in, max(1, int(self.channel_index) + 1))
+        need_channels = min(max_in, max(1, max(self.channels) + 1))
 
         # Если скорость не важна — увеличим blocksize для устойчивости на верхах
         if not getattr(self, "blocksize", None):
@@ -227,99 +637,586 @@ class Analisador:
         else:
             self.blocksize = int(self.blocksize)
 
-        # Параметры устойчивости: делаем мягче, чтобы "ожило"
-        conf_min_low = 0.45
-        conf_min_high = 0.55
-        split_high_hz = 350.0
-
-        # ВАЖНО: если не прошли проверки — явно ставим 0, чтобы UI не "зависал" на старом
+        # Callback работает в потоке PortAudio: здесь только копирование в кольцо.
+        # Любая задержка тут = потеря звука (input overflow), поэтому анализ вынесен в поток.
         def callback(indata, frames, time_info, status):
             try:
+                now = time.perf_counter()
+                self._stats["callbacks"] += 1
+                if status:
+                    self.instrumentation.status(status)
+                    if status.input_overflow:
+                        self._stats["input_overflows"] += 1
+                    if status.input_underflow:
+                        self._stats["input_underflows"] += 1
+
                 if indata is None or indata.size == 0:
                     return
 
                 # indata: (frames, channels)
+                trackers = self._channel_trackers
                 if indata.ndim == 1:
-                    mono = indata.astype(np.float32)
+                    indata = indata[:, None]
+                if trackers:
+                    # все входы разом; строка 0 — channel_index, дальше — трекеры по порядку
+                    block = self._deinterleave(indata)
+                    mono = block[0]
+                    for tracker, row in zip(trackers, block[1:]):
+                        tracker._push_ring(row)
                 else:
                     ch = indata.shape[1]
                     idx = min(max(int(self.channel_index), 0), ch - 1)
-                    mono = indata[:, idx].astype(np.float32)
+                    mono = indata[:, idx]
 
-                # noise gate
-                if float(np.max(np.abs(mono))) < self.volume_threshold:
-                    with self._lock:
-                        self._frequency = 0.0
-                    self._candidate_hits = 0
-                    return
-
-                # копим кольцо
                 self._push_ring(mono)
-                window = self._get_ring_window()
-                if window is None:
-                    return
 
-                # 1) YIN
-                raw_freq, conf = self._detect_pitch_yin(window, sr)
-                if raw_freq <= 0:
-                    with self._lock:
-                        self._frequency = 0.0
-                    self._candidate_hits = 0
-                    return
-
-                # 2) FFT уточнение рядом с кандидатом (но не душим, если FFT не сработал)
-                refined = self._refine_fft_near(window, sr, raw_freq,
-                                                bandwidth=60.0 if raw_freq >= split_high_hz else 40.0)
-                freq = refined if refined > 0 else raw_freq
-
-                # 3) стабилизация
-                stable = self._stabilize_frequency(freq)
-                if stable <= 0:
-                    with self._lock:
-                        self._frequency = 0.0
-                    self._candidate_hits = 0
-                    return
-
-                # порог уверенности (мягкий)
-                conf_min = conf_min_high if stable >= split_high_hz else conf_min_low
-                if conf < conf_min:
-                    with self._lock:
-                        self._frequency = 0.0
-                    self._candidate_hits = 0
-                    return
-
-                # гистерезис: меньше подтверждений, чтобы не "молчало"
-                if self._candidate_note_freq <= 0:
-                    self._candidate_note_freq = stable
-                    self._candidate_hits = 1
+                # время захвата последнего сэмпла блока (часы PortAudio -> perf_counter)
+                try:
+                    lag = float(time_info.currentTime) - float(time_info.inputBufferAdcTime)
+                except Exception:
+                    lag = 0.0
+                if 0.0 < lag < 1.0:
+                    t_last = min(now, now - lag + (frames - 1) / float(sr))
                 else:
-                    base = self._candidate_note_freq
-                    tol = 0.03 if stable >= split_high_hz else 0.04
-                    if base > 0 and abs(stable - base) / base < tol:
-                        self._candidate_hits += 1
-                        self._candidate_note_freq = (base * 0.8) + (stable * 0.2)
-                    else:
-                        self._candidate_note_freq = stable
-                        self._candidate_hits = 1
-
-                need_hits = 2 if stable >= split_high_hz else 2
-                if self._candidate_hits >= need_hits:
-                    with self._lock:
-                        self._frequency = float(self._candidate_note_freq)
-
-            except Exception:
+                    t_last = now
+                self._capture_stamp = (self._ring.written, t_last)
+                for tracker in trackers:
+                    tracker._capture_stamp = (tracker._ring.written, t_last)
+
+            except Exception as e:
+                # исключение из callback остановило бы поток — только считаем
+                self.instrumentation.exception(e, "callback")
                 return
 
+        # ядра CQT — здесь, а не на первом кадре в потоке анализа
+        self._prepare_kernels(sr)
+
+        extra = {"latency": "low"} if self.low_latency else {}
         self._stream = sd.InputStream(
             device=self.device,
             channels=need_channels,
             samplerate=sr,
             blocksize=int(self.blocksize),
             dtype='float32',
-            callback=callback
+            callback=callback,
+            **extra
         )
+        self._stream_sr = sr
+        self._start_worker(sr)
         self._stream.start()
 
+    def _start_worker(self, sr):
+        self._worker_stop = threading.Event()
+        self._worker = threading.Thread(
+            target=self._analysis_loop,
+            args=(sr, self._worker_stop),
+            name="AnalisadorWorker",
+            daemon=True
+        )
+        self._worker.start()
+
+    def _stop_worker(self):
+        stop, worker = self._worker_stop, self._worker
+        self._worker_stop = None
+        self._worker = None
+        if stop is not None:
+            stop.set()
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout=1.0)
+
+    def _hop(self):
+        return max(1, int(self.hop_size or self.blocksize))
+
+    def _analysis_loop(self, sr, stop_event):
+        """
+        Поток анализа: окна идут с фиксированным шагом hop (фиксированное перекрытие),
+        независимо от того, какими блоками их отдаёт устройство.
+        Если анализ отстал сильнее, чем на пару блоков — пропускаем шаги и берём свежее окно.
+        """
+        hop = self._hop()
+        # один блок устройства может принести сразу несколько шагов — это не отставание
+        max_behind = max(4, 2 * ((int(self.blocksize) + hop - 1) // hop))
+
+        while not stop_event.is_set():
+            written = self._ring.written
+            pending = written - self._ring_read_end
+
+            if pending < hop:
+                # ждём ровно столько, сколько нужно до следующего шага
+                stop_event.wait((hop - pending) / float(sr))
+                continue
+
+            behind = pending // hop
+            if behind > max_behind:
+                self._stats["hops_skipped"] += behind - 1
+                self.instrumentation.count("frames_dropped", behind - 1)
+                self._ring_read_end += (behind - 1) * hop
+
+            end = self._ring_read_end + hop
+            self._ring_read_end = end
+            self._run_hop(end, sr, hop)
+            # кольца входов пишутся одним callback — у всех один и тот же конец кадра
+            for tracker in self._channel_trackers:
+                tracker._run_hop(end, sr, hop)
+
+    def _run_hop(self, end, sr, hop):
+        """Один шаг анализа: окно, заканчивающееся на позиции end. True, если кадр проанализирован."""
+        self._analysis_window = self._choose_window(sr)
+        window = self._get_ring_window(end)
+        if window is None:
+            return False
+
+        t0 = time.perf_counter()
+        self._frame_end = end
+        try:
+            self._analyze_window(window, sr, hop)
+            self._stats["frames_analyzed"] += 1
+        except Exception as e:
+            self.instrumentation.exception(e, "analysis")
+            return False
+        finally:
+            t1 = time.perf_counter()
+            self.instrumentation.record("frame", t1 - t0)
+            self._account_hop_cost((t1 - t0) * 1000.0)
+            self._account_latency(end, t1, sr)
+
+        # окно — срез кольца: проверяем, что callback не перезаписал его во время анализа
+        if not self._ring.valid(end - window.size):
+            self._stats["ring_overruns"] += 1
+            self.instrumentation.count("frames_dropped")
+            return False
+        return True
+
+    # ================= OFFLINE =================
+    def analyze_array(self, samples, sample_rate, chunk_size=65536):
+        """
+        Прогоняет запись (NumPy-массив) через тот же конвейер, что и живой поток,
+        но без звуковой карты и без ожидания реального времени.
+        samples: (n,) или (n, channels) — берётся канал channel_index.
+        Генератор: на каждый шаг hop отдаёт PitchResult
+        (timestamp — секунды от начала записи, sample — позиция конца окна).
+        """
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples[:, None]
+
+        def chunks():
+            for i in range(0, samples.shape[0], int(chunk_size)):
+                yield samples[i:i + int(chunk_size)]
+
+        return self._analyze_offline(chunks(), int(sample_rate))
+
+    def analyze_file(self, path, chunk_size=65536):
+        """
+        То же, что analyze_array, но файл читается кусками по chunk_size кадров.
+        WAV (PCM 8/16/24/32 бит) читается стандартным модулем wave,
+        FLAC и float-WAV — через пакет soundfile (если установлен).
+        """
+        import wave
+
+        try:
+            wf = wave.open(str(path), "rb")
+        except (wave.Error, EOFError):
+            wf = None
+
+        if wf is None:
+            try:
+                import soundfile as sf
+            except ImportError:
+                raise RuntimeError(f"Для чтения {path} нужен пакет soundfile (pip install soundfile)")
+
+            sr = int(sf.info(str(path)).samplerate)
+            blocks = sf.blocks(str(path), blocksize=int(chunk_size), dtype="float32", always_2d=True)
+            return self._analyze_offline(blocks, sr)
+
+        return self._analyze_offline(_wave_chunks(wf, int(chunk_size)), int(wf.getframerate()))
+
+    def _analyze_offline(self, chunks, sr):
+        if self._running:
+            raise RuntimeError("Анализатор занят живым потоком: для файлов создайте отдельный Analisador")
+
+        self._reset_tracking()
+        self._prepare_kernels(sr)
+        hop = self._hop()
+        trackers = self._channel_trackers
+
+        for chunk in chunks:
+            if chunk.ndim == 1:
+                chunk = chunk[:, None]
+            if trackers:
+                block = self._deinterleave(chunk)
+                mono = block[0]
+            else:
+                ch = min(max(int(self.channel_index), 0), chunk.shape[1] - 1)
+                mono = chunk[:, ch]
+            # кусок файла может быть больше кольца — кладём его частями
+            step = self._ring.capacity - self._window_max
+            for i in range(0, mono.shape[0], step):
+                self._push_ring(np.asarray(mono[i:i + step], dtype=np.float32))
+                for tracker, row in zip(trackers, block[1:] if trackers else ()):
+                    tracker._push_ring(row[i:i + step])
+
+                while self._ring.written - self._ring_read_end >= hop:
+                    end = self._ring_read_end + hop
+                    self._ring_read_end = end
+                    for tracker in trackers:
+                        tracker._run_hop(end, sr, hop)
+                    if not self._run_hop(end, sr, hop):
+                        continue
+
+                    yield self._result
+
+    def _reset_pitch_state(self):
+        """Сброс стабилизации и гистерезиса: следующая нота подтверждается с нуля."""
+        self._candidate_note_freq = 0.0
+        self._candidate_hits = 0
+        if hasattr(self, "_freq_hist"):
+            self._freq_hist = []
+        if hasattr(self, "_last_good_freq"):
+            self._last_good_freq = 0.0
+
+    def _reset_tracking(self):
+        """Сброс стабилизации, кольца и результата (смена устройства или новый файл)."""
+        self._reset_pitch_state()
+        self._last_estimate = (0.0, 0.0)
+        self._init_buffers()
+        self._frame_index = 0
+        self._chord = None
+        self._note_levels = ()
+        if self._chord_detector is not None:
+            self._chord_detector.reset()
+        self._onset_detector = None
+        self._note_on = None
+        self._onset_pending = None
+        self._legato_pending = None
+        self._onset_sample = None
+        with self._lock:
+            self._history = ()
+            self._events = ()
+        self._publish(PitchResult(), record=False)
+        for tracker in self._channel_trackers:
+            tracker._reset_tracking()
+
+    def _capture_time(self, pos, sr):
+        """Время захвата (perf_counter) сэмпла с абсолютной позицией pos в кольце."""
+        stamp_pos, stamp_time = self._capture_stamp
+        if stamp_time <= 0:
+            return 0.0
+        return stamp_time - (stamp_pos - pos) / float(sr)
+
+    def _account_latency(self, end, t_result, sr):
+        t_capture = self._capture_time(end - 1, sr)
+        if t_capture <= 0:
+            return
+        ms = max(0.0, (t_result - t_capture) * 1000.0)
+        stats = self._stats
+        stats["latency_ms_last"] = ms
+        if stats["latency_ms_avg"] <= 0:
+            stats["latency_ms_avg"] = ms
+        else:
+            stats["latency_ms_avg"] = 0.9 * stats["latency_ms_avg"] + 0.1 * ms
+        if ms > stats["latency_ms_max"]:
+            stats["latency_ms_max"] = ms
+
+    def _account_hop_cost(self, ms):
+        stats = self._stats
+        if stats["frames_analyzed"] <= 1:
+            stats["analysis_ms_avg"] = ms
+        else:
+            stats["analysis_ms_avg"] = 0.95 * stats["analysis_ms_avg"] + 0.05 * ms
+        if ms > stats["analysis_ms_max"]:
+            stats["analysis_ms_max"] = ms
+
+    def _analyze_window(self, window, sr, hop):
+        # атаки — до высоты: на новой атаке стабилизация этого же кадра уже начинается заново
+        if self.onsets:
+            self._process_onsets(sr, hop)
+            window = self._window_after_onset(window, hop)
+
+        # спектр кадра считается один раз и живёт только в пределах этого кадра
+        self._spectrum = FrameSpectrum(window, sr)
+        try:
+            published = self._analyze_frame(window, sr, hop)
+            chord = self._analyze_chord(window, sr) if self.chords else None
+            if self.note_levels:
+                self._note_levels = self._analyze_note_levels(sr)
+        finally:
+            self._spectrum = None
+
+        # None — гистерезис ещё не подтвердил ноту: остаётся прежняя частота
+        frequency = self._frequency if published is None else published
+        raw_freq, confidence = self._last_estimate
+        rms, peak = self._frame_level
+        end = self._frame_end
+        timestamp = self._capture_time(end - 1, sr) or end / float(sr)
+        self._frame_index += 1
+        if chord is not None:
+            chord["timestamp"] = timestamp
+            chord["frame"] = self._frame_index
+            self._chord = chord
+        self._publish(PitchResult(frequency, raw_freq, confidence, rms, peak, timestamp, end,
+                                  self._frame_index, stable=bool(published)))
+        if self.onsets:
+            self._track_note(published, window, sr, hop)
+
+    def _process_onsets(self, sr, hop):
+        """Атаки в свежих сэмплах кольца (до конца кадра): закрыть звучащую ноту и сбросить стабилизацию."""
+        t0 = time.perf_counter()
+        end = self._frame_end
+        detector = self._onset_detector
+        if detector is None or detector.sr != int(sr):
+            detector = self._onset_detector = OnsetDetector(sr, min_level=self.volume_threshold / 2.0)
+            detector.reset(max(0, end - hop))
+
+        for sample, strength in detector.process(self._ring, end):
+            self.instrumentation.count("onsets")
+            if self._note_on is not None:
+                self._emit_event(NoteEvent("off", self._note_on.frequency, sample,
+                                           self._sample_time(sample, sr), 0.0))
+                self._note_on = None
+            self._onset_pending = (sample, strength)
+            self._legato_pending = None
+            self._onset_sample = sample
+            self._reset_pitch_state()
+
+        self.instrumentation.record("onset", time.perf_counter() - t0)
+
+    def _window_after_onset(self, window, hop):
+        """
+        Пока окно захватывает звук до последней атаки, режем его до звука новой ноты
+        (кратно 1024, как в _choose_window). Если после атаки меньше onset_min_window сэмплов —
+        кадр "оседает" (_settling): высоту не ищем, иначе гистерезис подтвердит хвост прошлой ноты.
+        """
+        self._settling = False
+        onset = self._onset_sample
+        if onset is None:
+            return window
+
+        after = self._frame_end - onset
+        if after >= window.size:
+            self._onset_sample = None
+            return window
+
+        n = after // 1024 * 1024
+        if n < self.onset_min_window:
+            self._settling = True
+            return window
+        return window[-n:]
+
+    def _track_note(self, published, window, sr, hop):
+        """
+        События нот по результату кадра: "on" — как только гистерезис подтвердил высоту после атаки
+        (время — у самой атаки), "off" — когда свежая часть кадра ушла под порог громкости.
+        Смена ноты без атаки (легато, слайд) больше чем на ~полтона — тоже "off" + "on", но только если
+        новая высота продержалась ещё шаг и её видит сам движок на этих кадрах (сырая оценка рядом):
+        иначе звенящая соседняя струна или медиана стабилизации между нотой и её октавой дали бы пару событий.
+        """
+        end = self._frame_end
+        note = self._note_on
+        pending = self._legato_pending
+        self._legato_pending = None
+
+        if published:
+            if note is not None and abs(published - note.frequency) / note.frequency < 0.03:
+                return
+            if note is not None:
+                raw = self._last_estimate[0]
+                if raw <= 0 or abs(raw - published) / published >= 0.03:
+                    return
+                if pending is None or abs(published - pending[0]) / pending[0] >= 0.03:
+                    # первый кадр новой высоты — ждём следующий, время смены — у этого кадра
+                    self._legato_pending = (published, end - hop)
+                    return
+                change = pending[1]
+                self._emit_event(NoteEvent("off", note.frequency, change, self._sample_time(change, sr)))
+                self._onset_pending = (change, 0.0)
+            sample, strength = self._onset_pending or (end - hop, 0.0)
+            self._onset_pending = None
+            self._note_on = NoteEvent("on", published, sample, self._sample_time(sample, sr), strength)
+            self._emit_event(self._note_on)
+            return
+
+        if self._frame_level[1] < self.volume_threshold:
+            self._onset_pending = None
+            if note is not None:
+                # последний сэмпл над порогом в свежей части кадра
+                loud = np.flatnonzero(np.abs(window[-hop:]) >= self.volume_threshold)
+                sample = end - hop + (int(loud[-1]) + 1 if loud.size else 0)
+                self._emit_event(NoteEvent("off", note.frequency, sample, self._sample_time(sample, sr)))
+                self._note_on = None
+
+    def _sample_time(self, pos, sr):
+        """Время сэмпла pos, как у PitchResult.timestamp: perf_counter в живом режиме, офлайн — pos / sr."""
+        return self._capture_time(pos, sr) or pos / float(sr)
+
+    def _analyze_frame(self, window, sr, hop):
+        """
+        Полный конвейер на одном окне: gate -> YIN -> FFT уточнение -> стабилизация -> гистерезис.
+        Возвращает частоту для публикации, None — оставить прежнюю (гистерезис ещё не подтвердил).
+        ВАЖНО: если не прошли проверки — явно возвращаем 0, чтобы UI не "зависал" на старом.
+        """
+        import numpy as np
+
+        split_high_hz = self.split_high_hz
+        instr = self.instrumentation
+        clock = time.perf_counter
+
+        self._last_estimate = (0.0, 0.0)
+
+        # noise gate по свежей части окна
+        t0 = clock()
+        fresh = window[-hop:]
+        peak = _peak_level(fresh)
+        self._frame_level = (float(np.sqrt(np.dot(fresh, fresh) / max(1, fresh.size))), peak)
+        gated = peak < self.volume_threshold
+        t1 = clock()
+        instr.record("gate", t1 - t0)
+        if gated:
+            instr.count("frames_gated")
+            self._candidate_hits = 0
+            return 0.0
+
+        if self._settling:
+            # сразу после атаки: звука новой ноты ещё мало (см. _window_after_onset)
+            return None
+
+        # 1) основной тон (по умолчанию YIN, см. set_engine)
+        raw_freq, conf = self._estimator.estimate(window, sr, self.fmin, self.fmax, spectrum=self._spectrum)
+        t2 = clock()
+        instr.record(self.engine, t2 - t1)
+        self._last_estimate = (raw_freq, conf)
+        if raw_freq <= 0:
+            instr.count("frames_no_pitch")
+            self._candidate_hits = 0
+            return 0.0
+
+        # 2) FFT уточнение рядом с кандидатом (но не душим, если FFT не сработал).
+        # На коротких окнах (low_latency) бин слишком широкий — там интерполяция YIN точнее.
+        refined = 0.0
+        if sr / float(window.size) <= self.refine_max_bin_hz:
+            refined = self._refine_fft_near(window, sr, raw_freq,
+                                            bandwidth=60.0 if raw_freq >= split_high_hz else 40.0)
+            t3 = clock()
+            instr.record("fft_refine", t3 - t2)
+            t2 = t3
+        freq = refined if refined > 0 else raw_freq
+
+        # 3) стабилизация
+        stable = self._stabilize_frequency(freq)
+        t3 = clock()
+        instr.record("stabilize", t3 - t2)
+        if stable <= 0:
+            instr.count("frames_unstable")
+            self._candidate_hits = 0
+            return 0.0
+
+        # порог уверенности (мягкий); у спектральных движков своя шкала (PitchEstimator.conf_min)
+        conf_low, conf_high = self._estimator.conf_min or (self.conf_min_low, self.conf_min_high)
+        conf_min = conf_high if stable >= split_high_hz else conf_low
+        if conf < conf_min:
+            instr.count("frames_low_confidence")
+            self._candidate_hits = 0
+            return 0.0
+
+        # гистерезис: меньше подтверждений, чтобы не "молчало"
+        if self._candidate_note_freq <= 0:
+            self._candidate_note_freq = stable
+            self._candidate_hits = 1
+        else:
+            base = self._candidate_note_freq
+            tol = 0.03 if stable >= split_high_hz else 0.04
+            if base > 0 and abs(stable - base) / base < tol:
+                self._candidate_hits += 1
+                self._candidate_note_freq = (base * 0.8) + (stable * 0.2)
+            else:
+                self._candidate_note_freq = stable
+                self._candidate_hits = 1
+
+        need_hits = 2 if stable >= split_high_hz else 2
+        published = None
+        if self._candidate_hits >= need_hits:
+            published = float(self._candidate_note_freq)
+            instr.count("frames_published")
+        instr.record("hysteresis", clock() - t3)
+        return published
+
+    def _analyze_chord(self, window, sr):
+        """
+        Аккорд по окну захвата, которое кончается там же, где кадр высоты (ChordDetector.window_size).
+        Совпадает по длине с окном высоты — берём уже посчитанный спектр кадра.
+        """
+        t0 = time.perf_counter()
+        detector = self._chord_detector
+        if detector is None:
+            detector = self._chord_detector = ChordDetector(sr=sr)
+
+        if self._frame_level[1] < self.volume_threshold:
+            detector.reset()
+            chord = {"chord": "", "root": "", "quality": "", "score": 0.0, "chroma": None}
+        else:
+            n = detector.window_size(sr)
+            end = self._frame_end
+            if n == window.size:
+                spectrum = self._spectrum
+            else:
+                spectrum = FrameSpectrum(self._ring.view(end, n), sr)
+            chord = detector.detect(spectrum)
+            if not self._ring.valid(end - n):
+                # callback успел перезаписать начало окна — кадр аккорда не считаем
+                self.instrumentation.count("chords_dropped")
+                chord = None
+
+        self.instrumentation.record("chord", time.perf_counter() - t0)
+        return chord
+
+    def _analyze_note_levels(self, sr):
+        """
+        Самые громкие ноты кадра для экрана тюнера: constant-Q по последним note_levels_size сэмплам,
+        12 бинов на октаву — каждый бин стоит на ноте. До трёх (нота, уровень 0..1 от самой громкой).
+        """
+        t0 = time.perf_counter()
+        n = self.note_levels_size
+        end = self._frame_end
+        levels = ()
+        if self._frame_level[1] >= self.volume_threshold:
+            spectrum = self._spectrum if self._spectrum.n == n else FrameSpectrum(self._ring.view(end, n), sr)
+            cq, kernel = spectrum.constant_q(12, *self.note_levels_range)
+            top = float(cq.max()) if cq.size else 0.0
+            if top > 0:
+                # только локальные максимумы: соседний полутон громкой ноты — её же утечка, не нота
+                padded = np.concatenate(([0.0], cq, [0.0]))
+                peaks = np.flatnonzero((cq >= padded[:-2]) & (cq > padded[2:]))
+                out = []
+                for k in peaks[np.argsort(cq[peaks])[::-1][:3]]:
+                    level = float(cq[k]) / top
+                    if level < 0.1:
+                        break
+                    m = int(round(69 + 12 * np.log2(kernel.freqs[k] / 440.0)))
+                    out.append((f"{PITCH_CLASSES[m % 12]}{m // 12 - 1}", level))
+                levels = tuple(out)
+            if not self._ring.valid(end - n):
+                # начало окна успели перезаписать — оставляем прошлые уровни
+                levels = self._note_levels
+
+        self.instrumentation.record("note_levels", time.perf_counter() - t0)
+        return levels
+
+    def _prepare_kernels(self, sr):
+        """
+        Ядра CQT (аккорды, уровни нот) — заранее, в вызывающем потоке: первое построение занимает
+        десятые доли секунды, и в потоке анализа на столько встал бы первый кадр.
+        """
+        from constant_q import constant_q_kernel
+
+        if not sr:
+            return
+        if self.chords:
+            if self._chord_detector is None:
+                self._chord_detector = ChordDetector()
+            self._chord_detector.prepare(sr)
+        if self.note_levels:
+            constant_q_kernel(int(sr), self.note_levels_size, 12, *self.note_levels_range)
+
     def _stabilize_frequency(self, raw_freq):
         """
         Простая стабилизация:
@@ -366,45 +1263,60 @@ class Analisador:
         """
         import numpy as np
 
-        x = mono.astype(np.float32)
+        x = np.asarray(mono, dtype=np.float32)
         n = x.size
         if n < 512:
             return 0.0, 0.0
 
         # Noise gate
-        if float(np.max(np.abs(x))) < self.volume_threshold:
+        if _peak_level(x) < self.volume_threshold:
             return 0.0, 0.0
 
-        # DC remove
-        x = x - float(np.mean(x))
+        # Низкие ноты: YIN на прореженном сигнале + уточнение на полной частоте
+        if self.low_band and 0 < self._candidate_note_freq < self.low_band_split_hz:
+            return self._detect_pitch_low_band(x, sr, fmin, fmax)
+
+        freq, confidence = self._yin_estimate(x, sr, fmin, fmax)
+        if self.low_band and 0 < freq < self.low_band_check_below_hz:
+            # ниже обычного fmin — только в low_band: проверяем, не октава ли это вниз
+            x64 = x.astype(np.float64)
+            x64 -= float(np.mean(x64))
+            freq = self._octave_up_check(x64, freq, sr, fmax)
+        return freq, confidence
+
+    def _yin_estimate(self, x, sr, fmin, fmax):
+        """Ядро YIN по уже проверенному (длина, gate) сигналу: (freq, confidence) или (0.0, 0.0)."""
+        import numpy as np
 
+        n = x.size
         tau_min = int(sr / fmax)
         tau_max = int(sr / fmin)
         tau_max = min(tau_max, n // 2)
         if tau_max <= tau_min + 2:
             return 0.0, 0.0
 
-        d = np.zeros(tau_max + 1, dtype=np.float32)
-        for tau in range(1, tau_max + 1):
-            diff = x[:-tau] - x[tau:]
-            d[tau] = float(np.dot(diff, diff))
+        # Функция разности без цикла по tau: d(tau) = m(tau) - 2 * r(tau),
+        # r и m — общие с MPM (pitch_engines.autocorrelation_terms)
+        acf, m, taus = autocorrelation_terms(x, tau_max)
+        d = m - 2.0 * acf
+        d[0] = 0.0
+        np.maximum(d, 0.0, out=d)  # убираем отрицательный шум округления FFT
 
-        cmndf = np.zeros_like(d)
-        cmndf[0] = 1.0
-        running_sum = 0.0
-        for tau in range(1, tau_max + 1):
-            running_sum += float(d[tau])
-            cmndf[tau] = d[tau] * tau / running_sum if running_sum > 0 else 1.0
+        # CMNDF через кумулятивную сумму
+        cmndf = np.ones(tau_max + 1, dtype=np.float64)
+        running_sum = np.cumsum(d[1:])
+        ok = running_sum > 0
+        cmndf[1:][ok] = d[1:][ok] * taus[1:][ok] / running_sum[ok]
 
         # Чем меньше cmndf в минимуме — тем лучше период
         threshold = 0.12
         tau = 0
-        for t in range(tau_min, tau_max):
-            if cmndf[t] < threshold:
-                while t + 1 <= tau_max and cmndf[t + 1] < cmndf[t]:
-                    t += 1
-                tau = t
-                break
+        below = np.flatnonzero(cmndf[tau_min:tau_max] < threshold)
+        if below.size:
+            t = int(below[0]) + tau_min
+            while t + 1 <= tau_max and cmndf[t + 1] < cmndf[t]:
+                t += 1
+            tau = t
 
         if tau == 0:
             tau = int(np.argmin(cmndf[tau_min:tau_max]) + tau_min)
@@ -437,6 +1349,97 @@ class Analisador:
 
         return freq, confidence
 
+    def _decimation_filter(self, factor):
+        """ФНЧ для прореживания в factor раз (считается один раз на factor)."""
+        import scipy.signal
+
+        h = self._decim_filters.get(factor)
+        if h is None:
+            # срез с запасом ниже новой Найквиста: гармоники гитары до ~0.8 * sr / (2 * factor) остаются
+            h = scipy.signal.firwin(16 * factor + 1, 0.8 / factor).astype(np.float32)
+            self._decim_filters[factor] = h
+        return h
+
+    def _decimate(self, x, factor):
+        """Полифазное прореживание: фильтр считается только в оставляемых отсчётах."""
+        import scipy.signal
+
+        h = self._decimation_filter(factor)
+        y = scipy.signal.upfirdn(h, x, up=1, down=factor)
+        # отрезаем переходные процессы фильтра по краям
+        edge = (h.size // factor) + 1
+        return np.asarray(y[edge:-edge], dtype=np.float32)
+
+    def _detect_pitch_low_band(self, x, sr, fmin, fmax):
+        """
+        YIN на прореженном в low_band_factor раз сигнале (лаги и FFT в factor раз короче),
+        потом уточнение периода на полной частоте: несколько прямых d(tau) вокруг найденного лага,
+        и проверка октавы: если сигнал так же периодичен на половине лага — нота на октаву выше.
+        """
+        import numpy as np
+
+        factor = int(self.low_band_factor)
+        xd = self._decimate(x, factor)
+        if xd.size < 512:
+            return self._yin_estimate(x, sr, fmin, fmax)
+
+        f_low, confidence = self._yin_estimate(xd, sr / float(factor), fmin, fmax)
+        if f_low <= 0:
+            return 0.0, 0.0
+
+        # уточнение на полной частоте: минимум функции разности в окрестности +-factor лагов
+        x64 = x.astype(np.float64)
+        x64 -= float(np.mean(x64))
+        n = x64.size
+        center = sr / f_low
+        lo = max(2, int(center) - factor - 1)
+        hi = min(n // 2, int(center) + factor + 2)
+        if hi - lo < 3:
+            return f_low, confidence
+
+        taus = np.arange(lo, hi + 1)
+        d = np.empty(taus.size, dtype=np.float64)
+        for i, tau in enumerate(taus):
+            diff = x64[:-tau] - x64[tau:]
+            d[i] = float(np.dot(diff, diff)) / (n - tau)
+
+        k = int(np.argmin(d))
+        better_tau = float(taus[k])
+        if 0 < k < d.size - 1:
+            y0, y1, y2 = d[k - 1], d[k], d[k + 1]
+            denom = (y0 - 2.0 * y1 + y2)
+            if abs(denom) > 1e-18:
+                better_tau += 0.5 * (y0 - y2) / denom
+
+        freq = self._octave_up_check(x64, float(sr / better_tau), sr, fmax)
+        if freq < fmin or freq > fmax:
+            return 0.0, 0.0
+
+        return freq, confidence
+
+    def _octave_up_check(self, x64, freq, sr, fmax):
+        """
+        YIN с низким fmin может взять период вдвое длиннее настоящего (октава вниз).
+        Нормированная разность сигнала с самим собой на половине лага почти ноль или не хуже,
+        чем на найденном (атака, затухание) — настоящий период там: возвращаем 2 * freq.
+        x64 — кадр (float64, без среднего).
+        """
+        import numpy as np
+
+        def distance(lag):
+            a, b = x64[:-lag], x64[lag:]
+            energy = float(np.dot(a, a) + np.dot(b, b))
+            diff = a - b
+            return float(np.dot(diff, diff)) / energy if energy > 0 else 1.0
+
+        tau = int(round(sr / freq))
+        half = int(round(sr / freq / 2.0))
+        if half < 2 or tau >= x64.size // 2 or 2.0 * freq > fmax:
+            return freq
+        if distance(half) < max(self.low_band_octave_check, 2.0 * distance(tau)):
+            return 2.0 * freq
+        return freq
+
     def _close_stream(self):
         try:
             if self.stream is not None:
@@ -474,14 +1477,28 @@ class Analisador:
         except Exception:
             pass
 
-    def reconfigure(self, device=None, channel_index=0, sample_rate=None, blocksize=None):
+    def reconfigure(self, device=None, channel_index=0, sample_rate=None, blocksize=None, hop_size=None,
+                    low_latency=None, engine=None, channels=None):
+        """channels — входы для одновременного анализа (см. set_channels), None — оставить прежние."""
         with self._stream_lock:
+            if channels is None:
+                channels = self.channels[1:]
             self.device = device
             self.channel_index = int(channel_index)
             if sample_rate:
                 self.sample_rate = int(sample_rate)
             if blocksize:
                 self.blocksize = int(blocksize)
+                self._blocksize_auto = False
+            if hop_size:
+                self.hop_size = int(hop_size)
+            if low_latency is not None and bool(low_latency) != self.low_latency:
+                self.low_latency = bool(low_latency)
+                # блок устройства — по новому режиму (окна пересоберёт _reset_tracking ниже)
+                if self._blocksize_auto:
+                    self.blocksize = self._mode_blocksize()
+            if engine:
+                self.set_engine(engine)
 
             was_running = bool(self._running)
 
@@ -506,17 +1523,11 @@ class Analisador:
                         pass
                 except Exception:
                     pass
+            self._stop_worker()
 
             # 2) сбросим внутреннюю стабилизацию, чтобы не "тащить хвост" старого устройства
-            self._candidate_note_freq = 0.0
-            self._candidate_hits = 0
-            if hasattr(self, "_freq_hist"):
-                self._freq_hist = []
-            if hasattr(self, "_last_good_freq"):
-                self._last_good_freq = 0.0
-            self._init_buffers()
-            with self._lock:
-                self._frequency = 0.0
+            self._channel_trackers = self._make_channel_trackers(channels)
+            self._reset_tracking()
 
             # 3) откроем заново, если анализатор был запущен
             if was_running:
@@ -537,14 +1548,260 @@ class Analisador:
                         pass
             finally:
                 self._stream = None
+                self._stop_worker()
 
-        with self._lock:
-            self._frequency = 0.0
+        self._publish(PitchResult(), record=False)
+        for tracker in self._channel_trackers:
+            tracker._publish(PitchResult(), record=False)
+
+    # ================= CHANNELS =================
+    @property
+    def channels(self):
+        """Анализируемые входы устройства: channel_index, затем входы трекеров (set_channels)."""
+        return (self.channel_index,) + tuple(t.channel_index for t in self._channel_trackers)
+
+    def set_channels(self, channels):
+        """
+        Анализировать одновременно входы channels (номера с 0; channel_index ведёт сам анализатор),
+        None или [] — только channel_index. Каждый вход получает свой трекер (channel()) с теми же
+        настройками; поток открыт заново на нужное число каналов, если анализатор запущен.
+        """
+        if self._running:
+            self.reconfigure(self.device, self.channel_index, channels=channels or ())
+            return
+        with self._stream_lock:
+            self._channel_trackers = self._make_channel_trackers(channels)
+
+    def channel(self, index):
+        """
+        Анализатор входа index: для channel_index — сам анализатор, иначе его трекер.
+        У трекера всё как у Analisador (subscribe, get_result, subscribe_events, get_note...),
+        только поток он не открывает: его кольцо пишет callback этого анализатора.
+        """
+        index = int(index)
+        if index == self.channel_index:
+            return self
+        for tracker in self._channel_trackers:
+            if tracker.channel_index == index:
+                return tracker
+        raise ValueError(f"Вход {index} не анализируется (channels={list(self.channels)})")
+
+    def get_channel_results(self):
+        """Последний PitchResult каждого входа: {номер входа: PitchResult} в порядке channels."""
+        results = {self.channel_index: self._result}
+        for tracker in self._channel_trackers:
+            results[tracker.channel_index] = tracker._result
+        return results
+
+    def _make_channel_trackers(self, channels):
+        """Трекер на каждый дополнительный вход: Analisador с теми же настройками, но без своего потока."""
+        extra = []
+        for ch in channels or ():
+            ch = int(ch)
+            if ch < 0:
+                raise ValueError(f"Номер входа не может быть отрицательным: {ch}")
+            if ch != self.channel_index and ch not in extra:
+                extra.append(ch)
+
+        trackers = []
+        for ch in extra:
+            tracker = Analisador(device=self.device, channel_index=ch, volume_threshold=self.volume_threshold,
+                                 sample_rate=self.sample_rate, blocksize=self.blocksize, hop_size=self.hop_size,
+                                 low_latency=self.low_latency, low_band=self.low_band, engine=self.engine,
+                                 onsets=self.onsets)
+            tracker.fmin, tracker.fmax = self.fmin, self.fmax
+            trackers.append(tracker)
+        return tuple(trackers)
+
+    def _deinterleave(self, block):
+        """
+        (frames, channels) -> (len(self.channels), frames) одним векторным копированием:
+        строка на вход, каждая непрерывна — кольца пишутся без проходов по чередующимся сэмплам.
+        Входов больше, чем у устройства, — берётся последний (как для channel_index).
+        """
+        last = block.shape[1] - 1
+        rows = [min(max(ch, 0), last) for ch in self.channels]
+        return np.ascontiguousarray(block.T[rows], dtype=np.float32)
 
     def get_frequency(self):
+        """Опрос текущей частоты (запасной путь; основной — subscribe)."""
         with self._lock:
             return float(self._frequency)
 
+    def get_result(self):
+        """Последний PitchResult (без блокировки: объект после публикации не меняется)."""
+        return self._result
+
+    def set_chords(self, enabled):
+        """Включить/выключить распознавание аккордов (можно на ходу, со следующего кадра)."""
+        enabled = bool(enabled)
+        if enabled and not self.chords and self._chord_detector is not None:
+            self._chord_detector.reset()
+        self.chords = enabled
+        if enabled:
+            self._prepare_kernels(self._stream_sr or self.sample_rate)
+        else:
+            self._chord = None
+
+    def set_note_levels(self, enabled):
+        """Включить/выключить уровни нот для тюнера (get_note_levels), можно на ходу."""
+        self.note_levels = bool(enabled)
+        if self.note_levels:
+            self._prepare_kernels(self._stream_sr or self.sample_rate)
+        else:
+            self._note_levels = ()
+
+    def get_note_levels(self):
+        """
+        Самые громкие ноты последнего кадра (без блокировки): ((нота, уровень 0..1), ...), громкая первой;
+        пусто — выключено, тишина или кадров ещё не было.
+        """
+        return self._note_levels
+
+    def get_chord(self):
+        """
+        Последний аккорд (без блокировки) или None, если распознавание выключено / кадров ещё не было:
+        {"chord": "Am" ("" — аккорда нет), "root", "quality" ("" — мажор, "m" — минор),
+         "score" 0..1, "chroma" (12 классов C..B), "timestamp", "frame"} — как у PitchResult.
+        """
+        return self._chord
+
+    def subscribe_events(self, callback):
+        """
+        callback(event: NoteEvent) — начало/конец ноты, из потока анализа (как subscribe: коротко).
+        События не коалесцируются: каждое защипывание приходит отдельно.
+        """
+        with self._lock:
+            if callback not in self._event_subscribers:
+                self._event_subscribers = self._event_subscribers + (callback,)
+        return callback
+
+    def unsubscribe_events(self, callback):
+        with self._lock:
+            self._event_subscribers = tuple(cb for cb in self._event_subscribers if cb != callback)
+
+    def get_events(self, n=None):
+        """Последние события нот, старые -> новые (кортеж, до history_size штук, без блокировки)."""
+        events = self._events
+        return events if n is None else events[-int(n):]
+
+    def get_note(self):
+        """NoteEvent("on") звучащей сейчас ноты или None."""
+        return self._note_on
+
+    def clock(self):
+        """
+        Текущее время в часах PitchResult.timestamp и NoteEvent.timestamp (с ними сверяют атаки, см. rhythm_session):
+        perf_counter, пока идёт захват (моменты захвата — уже с поправкой на задержку входа, см. callback),
+        офлайн — время последнего разобранного сэмпла записи.
+        """
+        if self._capture_stamp[1] > 0:
+            return time.perf_counter()
+        return float(self._result.timestamp)
+
+    def _emit_event(self, event):
+        with self._lock:
+            events = self._events + (event,)
+            if len(events) > self.history_size:
+                events = events[-self.history_size:]
+            self._events = events
+            subscribers = self._event_subscribers
+
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                self.instrumentation.exception(e, "subscriber")
+
+    def get_history(self, n=None):
+        """Последние результаты, старые -> новые (кортеж, до history_size штук, без блокировки)."""
+        history = self._history
+        return history if n is None else history[-int(n):]
+
+    def subscribe(self, callback):
+        """
+        callback(result: PitchResult) вызывается из потока анализа сразу после шага hop,
+        когда опубликованная частота изменилась (result.frequency == 0.0 — ноты нет).
+        Callback должен быть коротким: в Qt — только передать значение в сигнал (см. pitch_signal).
+        """
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers = self._subscribers + (callback,)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = tuple(cb for cb in self._subscribers if cb != callback)
+
+    def _publish(self, result, record=True):
+        """Публикует результат кадра; record=False — только сброс (в историю не пишем)."""
+        with self._lock:
+            changed = result.frequency != self._frequency
+            self._frequency = result.frequency
+            self._result = result
+            if record:
+                history = self._history + (result,)
+                if len(history) > self.history_size:
+                    history = history[-self.history_size:]
+                self._history = history
+            subscribers = self._subscribers
+
+        if not changed:
+            return
+        for callback in subscribers:
+            try:
+                callback(result)
+            except Exception as e:
+                self.instrumentation.exception(e, "subscriber")
+
+    def get_stream_stats(self):
+        """
+        Счётчики захвата/анализа (копия), чтобы проверить, пропали ли глитчи:
+        input_overflows/input_underflows — флаги PortAudio,
+        ring_overruns/hops_skipped — поток анализа не успевал.
+        analysis_load — доля времени шага, уходящая на анализ (>= 1.0 — не успеваем).
+        """
+        stats = dict(self._stats)
+        sr = self._stream_sr or self.sample_rate or 48000
+        hop = self._hop()
+        stats["hop_size"] = hop
+        stats["hop_ms"] = hop * 1000.0 / float(sr)
+        stats["analysis_load"] = stats["analysis_ms_avg"] / stats["hop_ms"]
+        stats["low_latency"] = self.low_latency
+        stats["engine"] = self.engine
+        stats["channels"] = list(self.channels)
+        stats["window"] = int(self._analysis_window)
+        stats["window_smooth"] = float(self._window_smooth)
+        stream = self._stream
+        try:
+            stats["input_latency_ms"] = float(stream.latency) * 1000.0 if stream is not None else 0.0
+        except Exception:
+            stats["input_latency_ms"] = 0.0
+        stats["ring_written"] = int(self._ring.written)
+        stats["ring_backlog"] = int(self._ring.written - self._ring_read_end)
+        return stats
+
+    def _instrumentation_stages(self):
+        # порядок стадий конвейера для вывода (движок подставляется по имени)
+        return ["ring_push", "onset", "gate", self.engine, "fft_refine", "stabilize", "hysteresis", "chord", "note_levels", "frame"]
+
+    def get_instrumentation(self):
+        """
+        Живой срез инструментирования:
+        stages — гистограммы по стадиям (count, mean/p50/p95/p99/max в мкс),
+        counters — frames_dropped / frames_gated / frames_no_pitch / frames_unstable /
+                   frames_low_confidence / frames_published, onsets (атаки) / chords_dropped,
+        exceptions — число исключений по типу (+ last_exception),
+        status_flags — флаги PortAudio из callback, stream — get_stream_stats().
+        """
+        snap = self.instrumentation.snapshot()
+        snap["stage_order"] = self._instrumentation_stages()
+        snap["stream"] = self.get_stream_stats()
+        return snap
+
+    def reset_instrumentation(self):
+        self.instrumentation.reset()
+
     # ================= INTERNAL =================
     def _loop(self):
         buffer_history = []
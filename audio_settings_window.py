@@ -6,10 +6,11 @@ class AudioSettingsWindow(QtWidgets.QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Audio Settings (sounddevice)")
-        self.setFixedSize(520, 260)
+        self.setFixedSize(520, 310)
 
         self.selected_device = None
         self.selected_channel_index = 0  # 0 -> Input 1, 1 -> Input 2
+        self.selected_engine = "yin"
 
         layout = QtWidgets.QVBoxLayout(self)
 
@@ -21,6 +22,13 @@ class AudioSettingsWindow(QtWidgets.QDialog):
         self.channel_combo = QtWidgets.QComboBox()
         layout.addWidget(self.channel_combo)
 
+        layout.addWidget(QtWidgets.QLabel("Pitch engine"))
+        self.engine_combo = QtWidgets.QComboBox()
+        # HPS на щипках часто ошибается на октаву — в настройках его нет (только benchmark.py engines)
+        for key, title in (("yin", "YIN (default)"), ("mpm", "McLeod (MPM)"), ("cepstrum", "Cepstrum")):
+            self.engine_combo.addItem(title, key)
+        layout.addWidget(self.engine_combo)
+
         btn_layout = QtWidgets.QHBoxLayout()
         self.apply_btn = QtWidgets.QPushButton("Apply")
         self.cancel_btn = QtWidgets.QPushButton("Cancel")
@@ -111,6 +119,7 @@ class AudioSettingsWindow(QtWidgets.QDialog):
     def apply(self):
         self.selected_device = self.device_combo.currentData()
         self.selected_channel_index = int(self.channel_combo.currentIndex())  # 0 или 1
+        self.selected_engine = self.engine_combo.currentData() or "yin"
         self.accept()
 
     def get_selected_device(self):
@@ -118,3 +127,6 @@ class AudioSettingsWindow(QtWidgets.QDialog):
 
     def get_selected_channel_index(self):
         return int(self.selected_channel_index)
+
+    def get_selected_engine(self):
+        return self.selected_engine
@@ -0,0 +1,437 @@
+# benchmark.py
+"""
+Бенчмарки анализатора без звуковой карты.
+
+    python benchmark.py engines      — сводка suite (щипки через Analisador) для каждого движка (pitch_engines)
+    python benchmark.py suite --json out.json
+                                     — синтетические щипки (Karplus-Strong) по всем нотам
+                                       NoteDetector через Analisador (офлайн), результат в JSON
+    python benchmark.py compare old.json new.json
+                                     — разница сводных метрик между двумя прогонами
+    python benchmark.py notes        — имена нот detect / detect_full / detect_batch на таблицах E2..E5 и B0..E6
+    python benchmark.py chords       — открытые аккорды (щипки Karplus-Strong по струнам) через Analisador,
+                                       доля кадров с верным аккордом по каждому аккорду и сиду
+
+Корпус детерминирован (--seed), поэтому JSON разных коммитов можно сравнивать напрямую.
+"""
+import argparse
+import datetime
+import json
+import subprocess
+import time
+
+import numpy as np
+
+from analisator import Analisador
+from note_detecter import NoteDetector, note_frequency
+from pitch_engines import ENGINES
+
+
+def cents_error(measured, true_freq):
+    if measured <= 0 or true_freq <= 0:
+        return float("nan")
+    return 1200.0 * float(np.log2(measured / true_freq))
+
+
+def summarize_errors(errors, detected, total, seconds, frames):
+    errors = np.asarray(errors, dtype=np.float64)
+    abs_err = np.abs(errors)
+    octave = int(np.sum(abs_err > 600.0))
+    fine = abs_err[abs_err <= 600.0]
+    return {
+        "frames": int(total),
+        "detection_rate": float(detected) / float(total) if total else 0.0,
+        "octave_error_rate": float(octave) / float(detected) if detected else 0.0,
+        # None, а не NaN: отчёт пишется строгим JSON (allow_nan=False)
+        "cents_median": float(np.median(fine)) if fine.size else None,
+        "cents_p95": float(np.percentile(fine, 95)) if fine.size else None,
+        "cpu_ms_per_frame": 1000.0 * seconds / float(frames) if frames else 0.0,
+    }
+
+
+def run_engine_benchmark(sr=48000, duration=1.0, noise=0.002, seed=0):
+    """
+    Для каждого движка — тот же корпус щипков, что в run_suite, через весь конвейер
+    Analisador.analyze_array (gate, порог уверенности, стабилизация, гистерезис):
+    движок, который угадывает стационарный тон, но не проходит пороги на щипке, виден здесь сразу.
+    """
+    results = {}
+    for name in ENGINES:
+        report = run_suite(sr=sr, duration=duration, noise=noise, seed=seed, analyzer_kwargs={"engine": name})
+        results[name] = report["summary"]
+    return results
+
+
+def karplus_strong(freq, sr, duration, rng, inharmonicity=0.3, t60=3.0, lead_in=0.2,
+                   noise=0.002, attack=True):
+    """
+    Щипок струны: Karplus-Strong с дробной задержкой и дисперсионным all-pass в петле
+    (негармоничность: верхние гармоники чуть выше кратных), шум и щелчок атаки.
+
+    Петля: y = x + g * z^-N * L(z) * AP(z) * y,
+      L(z)  = (1 - rho) + rho * z^-1           — ФНЧ + дробная часть задержки,
+      AP(z) = (c + z^-1) / (1 + c * z^-1)      — дисперсия, c = -inharmonicity.
+    N и rho подобраны так, чтобы фазовая задержка петли на freq была ровно sr / freq,
+    т.е. основной тон сигнала — ровно freq. Считается одним lfilter.
+    """
+    import scipy.signal
+
+    c = -float(inharmonicity)
+    w0 = 2.0 * np.pi * freq / sr
+
+    def delay_ap(w):
+        z = np.exp(-1j * w)
+        return -np.angle((c + z) / (1.0 + c * z)) / w
+
+    def delay_lp(w, rho):
+        return -np.angle((1.0 - rho) + rho * np.exp(-1j * w)) / w
+
+    rem = sr / freq - delay_ap(w0)
+    period = int(np.floor(rem))
+    frac = rem - period
+
+    lo, hi = 0.0, 1.0
+    for _ in range(50):
+        mid = 0.5 * (lo + hi)
+        if delay_lp(w0, mid) < frac:
+            lo = mid
+        else:
+            hi = mid
+    rho = 0.5 * (lo + hi)
+
+    g = np.exp(-6.91 / (t60 * freq))  # затухание на 60 дБ за t60 секунд
+    den = np.zeros(period + 3)
+    den[0] = 1.0
+    den[1] = c
+    den[period] -= g * c * (1.0 - rho)
+    den[period + 1] -= g * ((1.0 - rho) + rho * c)
+    den[period + 2] -= g * rho
+    num = np.array([1.0, c])
+
+    n = int(duration * sr)
+    excitation = np.zeros(n)
+    excitation[:period] = rng.uniform(-1.0, 1.0, period)
+    y = scipy.signal.lfilter(num, den, excitation)
+    y *= 0.5 / max(1e-9, float(np.max(np.abs(y))))
+
+    if attack:
+        # щелчок медиатора: несколько миллисекунд широкополосного шума
+        click = int(0.004 * sr)
+        y[:click] += 0.3 * rng.standard_normal(click) * np.exp(-np.arange(click) / (0.001 * sr))
+
+    lead = int(lead_in * sr)
+    out = np.concatenate((np.zeros(lead), y))
+    out += noise * rng.standard_normal(out.size)
+    return out.astype(np.float32)
+
+
+def run_suite(sr=48000, duration=1.5, detune_cents=30.0, noise=0.002, inharmonicity=0.3, seed=0,
+              analyzer_kwargs=None, overrides=None):
+    """
+    Каждая нота NoteDetector.guitar_frequencies (с расстройкой до +-detune_cents)
+    прогоняется через Analisador.analyze_array. Метрики по опубликованной частоте:
+    cents — ошибка относительно истинной, octave_error_rate — доля кадров с ошибкой > 600 cents,
+    time_to_stable_ms — от щипка до первого результата в пределах 50 cents,
+    cpu_ms_per_frame — время конвейера на один шаг hop.
+    """
+    rng = np.random.default_rng(seed)
+    detector = NoteDetector()
+    lead_in = 0.2
+    notes = []
+    pooled = []
+
+    for name, base in detector.guitar_frequencies.items():
+        true_f = base * 2.0 ** (rng.uniform(-detune_cents, detune_cents) / 1200.0)
+        x = karplus_strong(true_f, sr, duration, rng, inharmonicity=inharmonicity, lead_in=lead_in, noise=noise)
+
+        analyzer = Analisador(sample_rate=sr, **(analyzer_kwargs or {}))
+        for key, value in (overrides or {}).items():
+            setattr(analyzer, key, value)
+
+        errors = []
+        frames = 0
+        time_to_stable = None
+        spent = 0.0
+        records = analyzer.analyze_array(x, sr)
+        while True:
+            t0 = time.perf_counter()
+            rec = next(records, None)
+            spent += time.perf_counter() - t0
+            if rec is None:
+                break
+
+            frames += 1
+            if rec.timestamp < lead_in or rec.frequency <= 0:
+                continue
+            err = cents_error(rec.frequency, true_f)
+            errors.append(err)
+            if time_to_stable is None and abs(err) <= 50.0:
+                time_to_stable = (rec.timestamp - lead_in) * 1000.0
+
+        pooled.extend(errors)
+        row = summarize_errors(errors, len(errors), max(1, frames - int(lead_in * sr) // analyzer._hop()),
+                               spent, frames)
+        row.update({
+            "note": name,
+            "true_freq": float(true_f),
+            "time_to_stable_ms": time_to_stable,
+        })
+        notes.append(row)
+
+    stable = [r["time_to_stable_ms"] for r in notes if r["time_to_stable_ms"] is not None]
+    overall = summarize_errors(pooled, len(pooled), max(1, len(pooled)), 0.0, 0)
+    summary = {
+        "notes": len(notes),
+        "notes_never_stable": len(notes) - len(stable),
+        "cents_median": overall["cents_median"],
+        "cents_p95": overall["cents_p95"],
+        "octave_error_rate": overall["octave_error_rate"],
+        "detection_rate": float(np.mean([r["detection_rate"] for r in notes])),
+        "time_to_stable_ms_median": float(np.median(stable)) if stable else None,
+        "time_to_stable_ms_max": float(np.max(stable)) if stable else None,
+        "cpu_ms_per_frame": float(np.mean([r["cpu_ms_per_frame"] for r in notes])),
+    }
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "sr": sr,
+            "duration": duration,
+            "detune_cents": detune_cents,
+            "noise": noise,
+            "inharmonicity": inharmonicity,
+            "seed": seed,
+            "analyzer": analyzer_kwargs or {},
+            "overrides": overrides or {},
+        },
+        "summary": summary,
+        "notes": notes,
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _parse_overrides(items):
+    """--set conf_min_low=0.5 -> {"conf_min_low": 0.5}"""
+    result = {}
+    for item in items or []:
+        key, _, value = item.partition("=")
+        try:
+            result[key.strip()] = json.loads(value)
+        except ValueError:
+            result[key.strip()] = value
+    return result
+
+
+def _fmt(value, width, spec):
+    """Число по spec в колонку width; None (нет данных) — "-"."""
+    return ("-" if value is None else format(value, spec)).rjust(width)
+
+
+def print_suite(report):
+    print(f"commit: {report['meta']['commit']}")
+    print("note".ljust(6) + "true Hz".rjust(10) + "cents med".rjust(11) + "p95".rjust(9)
+          + "octave".rjust(9) + "detect".rjust(9) + "stable ms".rjust(11) + "cpu ms".rjust(9))
+    for r in report["notes"]:
+        stable = "-" if r["time_to_stable_ms"] is None else f"{r['time_to_stable_ms']:.0f}"
+        print(r["note"].ljust(6) + f"{r['true_freq']:10.2f}" + _fmt(r["cents_median"], 11, ".2f")
+              + _fmt(r["cents_p95"], 9, ".2f") + f"{r['octave_error_rate']:9.3f}{r['detection_rate']:9.3f}"
+              + stable.rjust(11) + f"{r['cpu_ms_per_frame']:9.3f}")
+    print()
+    for key, value in report["summary"].items():
+        print(f"{key}: {value}")
+
+
+def compare_reports(old, new):
+    print("metric".ljust(28) + "old".rjust(12) + "new".rjust(12) + "delta".rjust(12))
+    for key, new_value in new["summary"].items():
+        old_value = old["summary"].get(key)
+        if isinstance(new_value, (int, float)) and isinstance(old_value, (int, float)):
+            print(key.ljust(28) + f"{old_value:12.3f}{new_value:12.3f}{new_value - old_value:+12.3f}")
+        else:
+            print(key.ljust(28) + str(old_value).rjust(12) + str(new_value).rjust(12))
+
+
+# (нижняя, верхняя нота таблицы, частота, ожидаемое имя)
+NOTE_NAME_CASES = (
+    ("B0", "E6", 440.0, "A4"),
+    ("B0", "E6", 440.2, "A4"),
+    ("B0", "E6", 30.87, "B0"),
+    ("B0", "E6", 82.5, "E2"),
+    ("B0", "E6", 110.3, "A2"),
+    ("B0", "E6", 1318.51, "E6"),
+    ("E2", "E5", 440.0, "A4"),
+    ("E2", "E5", 82.41, "E2"),
+    ("E2", "E5", 659.25, "E5"),
+)
+
+
+def check_note_names(cases=NOTE_NAME_CASES):
+    """
+    Имя ноты внутри таблицы должно нести свою октаву во всех трёх путях:
+    detect, detect_full (и его поле octave) и detect_batch. Возвращает список расхождений.
+    """
+    failures = []
+    for low, high, freq, expected in cases:
+        detector = NoteDetector(low=low, high=high)
+        full = detector.detect_full(freq) or {}
+        batch = detector.detect_batch([freq])
+        index = int(batch["index"][0])
+        got = {
+            "detect": detector.detect(freq),
+            "detect_full": full.get("note"),
+            "detect_full.octave": full.get("octave"),
+            "detect_batch": detector.note_names[index] if index >= 0 else None,
+            "detect_batch.octave": int(batch["octave"][0]),
+        }
+        want = {"detect": expected, "detect_full": expected, "detect_full.octave": int(expected[-1]),
+                "detect_batch": expected, "detect_batch.octave": int(expected[-1])}
+        for key, value in want.items():
+            if got[key] != value:
+                failures.append(f"{low}..{high} {freq} Гц: {key} = {got[key]!r}, ожидалось {value!r}")
+    return failures
+
+
+# открытые аккорды гитары: ноты струн снизу вверх
+OPEN_CHORDS = {
+    "C": "C3 E3 G3 C4 E4",
+    "G": "G2 B2 D3 G3 B3 G4",
+    "D": "D3 A3 D4 F#4",
+    "A": "A2 E3 A3 C#4 E4",
+    "E": "E2 B2 E3 G#3 B3 E4",
+    "Am": "A2 E3 A3 C4 E4",
+    "Em": "E2 B2 E3 G3 B3 E4",
+    "Dm": "D3 A3 D4 F4",
+}
+
+
+def strum(notes, sr, rng, duration=2.0, lead_in=0.2, stagger=0.012, noise=0.002):
+    """Бой по струнам: щипок Karplus-Strong на каждую ноту, струны с шагом stagger, громкость случайная."""
+    lead = int(lead_in * sr)
+    out = np.zeros(lead + int(duration * sr))
+    for i, name in enumerate(notes.split()):
+        y = karplus_strong(note_frequency(name), sr, duration, rng, lead_in=0.0, noise=0.0)
+        start = lead + int(i * stagger * sr)
+        out[start:] += rng.uniform(0.6, 1.0) * y[:out.size - start]
+    out *= 0.6 / max(1e-9, float(np.max(np.abs(out))))
+    out += noise * rng.standard_normal(out.size)
+    return out.astype(np.float32)
+
+
+def run_chord_benchmark(sr=48000, seeds=6, duration=2.0, noise=0.002, settle=0.5):
+    """
+    Каждый аккорд OPEN_CHORDS с сидами 0..seeds-1 через Analisador(chords=True).analyze_array.
+    Точность — доля кадров после settle секунд (выше gate), где get_chord() называет этот аккорд.
+    Возвращает {аккорд: [точность по сидам]} и среднее время стадии chord на кадр, мкс.
+    """
+    results = {}
+    chord_us = []
+    for name, notes in OPEN_CHORDS.items():
+        results[name] = []
+        for seed in range(seeds):
+            x = strum(notes, sr, np.random.default_rng(seed), duration=duration, noise=noise)
+            analyzer = Analisador(sample_rate=sr, hop_size=1024, chords=True)
+            hits = frames = 0
+            for result in analyzer.analyze_array(x, sr):
+                if result.timestamp <= settle or result.peak < analyzer.volume_threshold:
+                    continue
+                chord = analyzer.get_chord()
+                frames += 1
+                hits += bool(chord) and chord["chord"] == name
+            results[name].append(hits / frames if frames else 0.0)
+            chord_us.append(analyzer.get_instrumentation()["stages"]["chord"]["mean_us"])
+    return results, float(np.mean(chord_us))
+
+
+def print_table(results):
+    cols = ("notes_never_stable", "detection_rate", "octave_error_rate", "cents_median", "cents_p95",
+            "time_to_stable_ms_median", "cpu_ms_per_frame")
+    print("engine".ljust(10) + "".join(c.rjust(26) for c in cols))
+    for name, row in results.items():
+        print(name.ljust(10) + "".join("-".rjust(26) if row[c] is None else f"{row[c]:26.3f}" for c in cols))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки анализатора")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    eng = sub.add_parser("engines", help="сравнение движков определения высоты")
+    eng.add_argument("--sr", type=int, default=48000)
+    eng.add_argument("--duration", type=float, default=1.0)
+    eng.add_argument("--noise", type=float, default=0.002)
+    eng.add_argument("--seed", type=int, default=0)
+
+    suite = sub.add_parser("suite", help="щипки Karplus-Strong по всем нотам через Analisador")
+    suite.add_argument("--sr", type=int, default=48000)
+    suite.add_argument("--duration", type=float, default=1.5)
+    suite.add_argument("--detune", type=float, default=30.0, help="максимальная расстройка, cents")
+    suite.add_argument("--noise", type=float, default=0.002)
+    suite.add_argument("--inharmonicity", type=float, default=0.3)
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--engine", default="yin")
+    suite.add_argument("--hop", type=int, default=None)
+    suite.add_argument("--low-latency", action="store_true")
+    suite.add_argument("--low-band", action="store_true")
+    suite.add_argument("--set", action="append", metavar="ATTR=VALUE",
+                       help="переопределить атрибут анализатора, например conf_min_low=0.5")
+    suite.add_argument("--json", help="куда сохранить результат")
+
+    cmp_ = sub.add_parser("compare", help="сравнить два JSON-отчёта suite")
+    cmp_.add_argument("old")
+    cmp_.add_argument("new")
+
+    sub.add_parser("notes", help="проверка имён нот (октава) в detect / detect_full / detect_batch")
+
+    chords = sub.add_parser("chords", help="открытые аккорды (бой Karplus-Strong) через Analisador")
+    chords.add_argument("--sr", type=int, default=48000)
+    chords.add_argument("--seeds", type=int, default=6, help="сиды 0..N-1 на каждый аккорд")
+    chords.add_argument("--noise", type=float, default=0.002)
+
+    args = parser.parse_args()
+
+    if args.command == "engines":
+        print_table(run_engine_benchmark(sr=args.sr, duration=args.duration, noise=args.noise, seed=args.seed))
+
+    elif args.command == "suite":
+        analyzer_kwargs = {"engine": args.engine, "hop_size": args.hop,
+                           "low_latency": args.low_latency, "low_band": args.low_band}
+        report = run_suite(sr=args.sr, duration=args.duration, detune_cents=args.detune, noise=args.noise,
+                           inharmonicity=args.inharmonicity, seed=args.seed,
+                           analyzer_kwargs=analyzer_kwargs, overrides=_parse_overrides(args.set))
+        print_suite(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2, allow_nan=False)
+            print(f"saved: {args.json}")
+
+    elif args.command == "compare":
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        compare_reports(old, new)
+
+    elif args.command == "notes":
+        failures = check_note_names()
+        for line in failures:
+            print(line)
+        print(f"notes: {len(NOTE_NAME_CASES)} cases, {len(failures)} failures")
+        if failures:
+            raise SystemExit(1)
+
+    elif args.command == "chords":
+        results, chord_us = run_chord_benchmark(sr=args.sr, seeds=args.seeds, noise=args.noise)
+        for name, accs in results.items():
+            print(f"{name:4s} {np.mean(accs):6.3f}   " + " ".join(f"{a:.2f}" for a in accs))
+        print(f"mean {np.mean([np.mean(a) for a in results.values()]):6.3f}   chord {chord_us:.0f} us/frame")
+
+
+if __name__ == "__main__":
+    main()
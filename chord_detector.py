@@ -0,0 +1,196 @@
+# chord_detector.py
+import numpy as np
+
+from constant_q import constant_q_kernel
+from note_detecter import PITCH_CLASSES
+
+# Трезвучия из библиотеки ("Как строятся аккорды"): интервалы от тоники в полутонах.
+# Ключ — суффикс в названии аккорда: "C", "Cm".
+CHORD_QUALITIES = {
+    "": (0, 4, 7),   # мажор
+    "m": (0, 3, 7),  # минор
+}
+
+
+def _midi_frequency(m, a4=440.0):
+    return a4 * 2.0 ** ((np.asarray(m, dtype=np.float64) - 69.0) / 12.0)
+
+
+class ChordDetector:
+    """
+    Полифонический анализ одного кадра (аккорды):
+    спектр кадра -> лог-частотный спектр (одна полоса на полутон)
+    -> гармоническое суммирование (салиентность высот: у каждой ноты складываются её гармоники)
+    -> ноты по очереди, каждая вычитает свои гармоники -> хрома (12 классов высоты)
+    -> ближайший шаблон трезвучия, с небольшим перевесом у аккорда от басовой ноты.
+
+    Лог-частотный спектр — constant-Q спектр кадра (FrameSpectrum.constant_q, 3 бина на полутон,
+    ядро кэшируется), дальше на кадр — несколько сложений массивов по ~90 полутонам.
+    Окно длиннее, чем для одной ноты: на E2..G2 полутон меньше 6 Гц, ядро CQT не длиннее кадра,
+    а на затухании аккорда короткое окно теряет слабые струны (см. window_size).
+    """
+
+    bins_per_semitone = 3
+
+    # окно ~0.3 с (16384 @ 44.1/48kHz), но не длиннее MAX_WINDOW
+    window_seconds = 0.3
+    MAX_WINDOW = 32768
+
+    def __init__(self, low=40, high=84, harmonics=5, harmonic_decay=0.8, min_score=0.75,
+                 smoothing=0.6, a4=440.0, sr=None):
+        """
+        low/high — диапазон высот (MIDI) для салиентности: E2..C6,
+        harmonics — сколько гармоник складывать, harmonic_decay — вес каждой следующей,
+        min_score — ниже этого сходства с шаблоном аккорд не называем,
+        smoothing — сглаживание хромы между кадрами (0 — без сглаживания),
+        sr — если известна частота дискретизации, ядро CQT строится сразу (см. prepare).
+        """
+        self.low = int(low)
+        self.high = int(high)
+        self.harmonics = int(harmonics)
+        self.harmonic_decay = float(harmonic_decay)
+        self.min_score = float(min_score)
+        self.smoothing = float(smoothing)
+        self.a4 = float(a4)
+        # не больше max_notes нот на кадр (6 струн), ноты слабее note_floor * самой сильной — шум
+        self.max_notes = 6
+        self.note_floor = 0.15
+        # выбранная нота убирает из лог-спектра subtract_harmonics своих гармоник (у струны
+        # заметны до ~12-й: 7-я и 9-я иначе становятся лишними нотами), с spread_from-й —
+        # и соседние полутона (округление 12*log2(h) и негармоничность струны)
+        self.subtract_harmonics = 16
+        self.spread_from = 6
+        # бас — самая низкая из нот не слабее bass_floor * самой сильной; аккорду с тоникой
+        # в басе к сходству с шаблоном добавляется bass_weight (G, а не Em; D, а не Bm)
+        self.bass_floor = 0.5
+        self.bass_weight = 0.1
+
+        # сдвиг h-й гармоники в полутонах: 0, 12, 19, 24, 28, ...
+        h = np.arange(1, self.harmonics + 1)
+        self._offsets = np.round(12.0 * np.log2(h)).astype(int)
+        self._weights = self.harmonic_decay ** (h - 1)
+
+        h = np.arange(1, self.subtract_harmonics + 1)
+        sub = np.round(12.0 * np.log2(h)).astype(int)
+        wide = sub[h >= self.spread_from]
+        self._sub_offsets = np.unique(np.concatenate([sub, wide - 1, wide + 1]))
+
+        # лог-спектр нужен выше самой высокой ноты — до её последней (вычитаемой) гармоники
+        self._log_low = self.low
+        self._log_high = self.high + int(max(self._offsets[-1], self._sub_offsets[-1]))
+
+        # диапазон CQT: от нижнего до верхнего бина полутонов _log_low.._log_high
+        half = (self.bins_per_semitone // 2) / (12.0 * self.bins_per_semitone)
+        self._cq_range = (float(_midi_frequency(self._log_low - 12.0 * half, self.a4)),
+                          float(_midi_frequency(self._log_high + 12.0 * half, self.a4)))
+
+        self._names, self._templates = self._build_templates()
+        self._roots = np.array([PITCH_CLASSES.index(root) for root, _ in self._names])
+        self.reset()
+        if sr:
+            self.prepare(sr)
+
+    def reset(self):
+        """Сброс сглаживания (новая запись, тишина)."""
+        self._chroma = None
+
+    def window_size(self, sr):
+        """Длина окна (степень двойки) для частоты дискретизации sr."""
+        n = 1 << int(np.ceil(np.log2(self.window_seconds * float(sr))))
+        return min(n, self.MAX_WINDOW)
+
+    def prepare(self, sr):
+        """
+        Строит ядро CQT для окна window_size(sr) заранее (оно кэшируется, см. constant_q_kernel).
+        Первое построение — десятые доли секунды: вызывать не из потока анализа, иначе встанет первый кадр.
+        """
+        fmin, fmax = self._cq_range
+        return constant_q_kernel(int(sr), self.window_size(sr), 12 * self.bins_per_semitone, fmin, fmax, self.a4)
+
+    @staticmethod
+    def _build_templates():
+        names = []
+        rows = []
+        for quality, intervals in CHORD_QUALITIES.items():
+            for root in range(12):
+                t = np.zeros(12, dtype=np.float64)
+                t[[(root + i) % 12 for i in intervals]] = 1.0
+                names.append((PITCH_CLASSES[root], quality))
+                rows.append(t / np.linalg.norm(t))
+        return names, np.vstack(rows)
+
+    def log_spectrum(self, spectrum):
+        """Максимум CQT-модуля в каждой полутоновой полосе (от _log_low вверх)."""
+        fmin, fmax = self._cq_range
+        cq, kernel = spectrum.constant_q(12 * self.bins_per_semitone, fmin, fmax, self.a4)
+        count = self._log_high - self._log_low + 1
+        # сверху диапазон мог обрезать Найквист — недостающие полутона нулевые
+        bands = np.zeros(count * self.bins_per_semitone, dtype=np.float64)
+        bands[:cq.size] = cq[:bands.size]
+        return bands.reshape(count, self.bins_per_semitone).max(axis=1)
+
+    def _harmonic_sum(self, L):
+        count = self.high - self.low + 1
+        s = np.zeros(count, dtype=np.float64)
+        for off, w in zip(self._offsets, self._weights):
+            s += w * L[off:off + count]
+        return s
+
+    def salience(self, spectrum):
+        """Салиентность высот low..high: взвешенная сумма гармоник каждой ноты."""
+        return self._harmonic_sum(np.sqrt(self.log_spectrum(spectrum)))  # sqrt — мягкое сжатие динамики
+
+    def _pick_notes(self, spectrum):
+        """Хрома кадра (не нормированная) и класс басовой ноты (None — нот нет)."""
+        L = np.sqrt(self.log_spectrum(spectrum))
+        c = np.zeros(12, dtype=np.float64)
+        first = 0.0
+        bass = None
+        for _ in range(self.max_notes):
+            s = self._harmonic_sum(L)
+            p = int(np.argmax(s))
+            if s[p] <= 0 or s[p] < self.note_floor * first:
+                break
+            first = first or float(s[p])
+            c[(self.low + p) % 12] += s[p]
+            if s[p] >= self.bass_floor * first and (bass is None or p < bass):
+                bass = p
+            idx = p + self._sub_offsets
+            L[idx[idx < L.size]] = 0.0
+        return c, (None if bass is None else (self.low + bass) % 12)
+
+    def chroma(self, spectrum):
+        """
+        12-мерная хрома (C..B), нормированная на единичную длину; нули — если сигнала нет.
+        Ноты выбираются по очереди: самая салиентная высота забирает свои гармоники из лог-спектра,
+        иначе 3-я и 5-я гармоники (квинта и большая терция) добавляют в хрому ноты, которых не играли
+        (E2 даёт G#, и Em превращается в E).
+        """
+        c, _ = self._pick_notes(spectrum)
+        norm = float(np.linalg.norm(c))
+        return c / norm if norm > 0 else c
+
+    def detect(self, spectrum):
+        """
+        Аккорд кадра: {"chord": "Am" ("" — не распознан), "root": "A", "quality": "m",
+        "score": сходство с шаблоном 0..1, "chroma": сглаженная хрома}.
+        """
+        c, bass = self._pick_notes(spectrum)
+        norm = float(np.linalg.norm(c))
+        if norm > 0:
+            c = c / norm
+        if self._chroma is not None and self.smoothing > 0:
+            c = self.smoothing * self._chroma + (1.0 - self.smoothing) * c
+            norm = float(np.linalg.norm(c))
+            if norm > 0:
+                c = c / norm
+        self._chroma = c
+
+        scores = self._templates @ c
+        # выбор — с перевесом у тоники в басе, score — чистое сходство с шаблоном
+        i = int(np.argmax(scores + self.bass_weight * (self._roots == bass)))
+        score = float(scores[i])
+        root, quality = self._names[i]
+        if score < self.min_score:
+            return {"chord": "", "root": "", "quality": "", "score": score, "chroma": c}
+        return {"chord": root + quality, "root": root, "quality": quality, "score": score, "chroma": c}
@@ -1,6 +1,8 @@
 from PyQt5 import QtWidgets, QtCore
 from PyQt5 import QtGui
 from note_detecter import NoteDetector
+from pitch_signal import PitchSignalBridge
+from rhythm_session import RhythmSession
 import random
 import time
 
@@ -27,6 +29,12 @@ class GameWindow(QtWidgets.QWidget):
 
         self.setup_ui()
         self.timer = None
+        self.pitch_bridge = None
+        self._recheck_pending = False
+
+        # ритм-режим: партия со временем, атаки сверяются по часам анализатора
+        self.rhythm_session = None
+        self.rhythm_timer = None
 
         # Если при создании передали анализатор — подключаем и запускаем таймер
         if frequency_source:
@@ -57,12 +65,23 @@ class GameWindow(QtWidgets.QWidget):
         self.confirm_btn.setEnabled(False)
 
     def set_frequency_source(self, source):
-        """Устанавливаем источник частоты и запускаем таймер"""
+        """
+        Устанавливаем источник частоты. Если он умеет subscribe (Analisador) —
+        получаем частоту сигналом сразу после анализа, иначе опрашиваем таймером.
+        Если анализатор ищет атаки (onsets) — ноту засчитываем по событию "on".
+        """
         self.frequency_source = source
-        if not self.timer:
-            self.timer = QtCore.QTimer()
-            self.timer.timeout.connect(self.update_note)
-            self.timer.start(100)
+        if hasattr(source, "subscribe"):
+            if self.pitch_bridge is None:
+                self.pitch_bridge = PitchSignalBridge(parent=self)
+                self.pitch_bridge.frequency_changed.connect(self.update_note)
+                self.pitch_bridge.note_event.connect(self.on_note_event)
+            self.pitch_bridge.attach(source)
+            if self.timer:
+                self.timer.stop()
+                self.timer = None
+        elif not self.timer:
+            self.setup_timer()
         print("[GameWindow] Frequency source установлен")
 
     # ================= UI =================
@@ -181,6 +200,19 @@ class GameWindow(QtWidgets.QWidget):
         self.confirm_btn.clicked.connect(self.confirm_note)
         layout.addWidget(self.confirm_btn, alignment=QtCore.Qt.AlignCenter)
 
+        # ---------- RHYTHM MODE ----------
+        rhythm_row = QtWidgets.QHBoxLayout()
+        self.rhythm_btn = QtWidgets.QPushButton("RHYTHM MODE")
+        self.rhythm_btn.setCheckable(True)
+        rhythm_row.addWidget(self.rhythm_btn)
+        # поправка на задержку вывода (картинка/звук): + если атаки засчитываются поздними
+        self.rhythm_offset = QtWidgets.QSpinBox()
+        self.rhythm_offset.setRange(-300, 300)
+        self.rhythm_offset.setPrefix("OFFSET ")
+        self.rhythm_offset.setSuffix(" ms")
+        rhythm_row.addWidget(self.rhythm_offset)
+        layout.addLayout(rhythm_row)
+
         # ---------- START ----------
         self.start_battle_btn = QtWidgets.QPushButton("START LEVEL")
         self.start_battle_btn.clicked.connect(self.start_battle)
@@ -261,7 +293,11 @@ class GameWindow(QtWidgets.QWidget):
         items.sort(key=lambda kv: kv[1])  # по частоте
         return [name for name, _ in items]
 
-    def generate_notes_for_level(self, level_index):
+    def generate_notes_for_level(self, level_index, with_timing=False):
+        """
+        Цели уровня. with_timing=True — партия для ритм-режима: [(нота, время от старта в сек), ...],
+        темп растёт с уровнем, перед первой нотой — отсчёт в 4 доли.
+        """
         levels = [
             ("E4", "E5"),
             ("A3", "A4"),
@@ -281,7 +317,20 @@ class GameWindow(QtWidgets.QWidget):
 
         # ✅ всегда 7 целей (если в пуле меньше — возьмём сколько есть)
         k = min(7, len(note_pool))
-        return random.sample(note_pool, k=k)
+        notes = random.sample(note_pool, k=k)
+        if not with_timing:
+            return notes
+
+        # между нотами 1–2 доли, с 4-го уровня — и полдоли
+        bpm = 60 + 10 * ((level_index - 1) % len(levels))
+        beat = 60.0 / bpm
+        gaps = (1, 2) if level_index < 4 else (0.5, 1, 2)
+        chart = []
+        t = 4 * beat
+        for note in notes:
+            chart.append((note, round(t, 3)))
+            t += random.choice(gaps) * beat
+        return chart
 
     def _pitch_class(self, note: str) -> str:
         """
@@ -310,7 +359,20 @@ class GameWindow(QtWidgets.QWidget):
         except:
             return True
 
+    def rhythm_available(self):
+        """Ритм-режиму нужны атаки с временем захвата: Analisador с onsets и подпиской через мост."""
+        source = self.frequency_source
+        return (self.pitch_bridge is not None and hasattr(source, "clock")
+                and getattr(source, "onsets", False))
+
     def start_battle(self):
+        if self.rhythm_btn.isChecked():
+            if self.rhythm_available():
+                self.start_rhythm()
+                return
+            self._show_damage_message("Ритм-режиму нужен анализатор с атаками (onsets)")
+            self.rhythm_btn.setChecked(False)
+
         self.game_active = True
         self.waiting_for_player = False
         self.current_target_index = 0
@@ -320,7 +382,86 @@ class GameWindow(QtWidgets.QWidget):
         self.played_note.setText("YOUR NOTE: --")
         self.update_target_display()
 
+    def start_rhythm(self):
+        self.stop_game()
+        chart = self.generate_notes_for_level(self.current_level, with_timing=True)
+        self.target_notes = [note for note, _ in chart]
+        self.enemy_lives_count = len(chart)
+        self.enemy_lives.setText(f"ENEMY HP: {self.enemy_lives_count}")
+        self.played_note.setText("YOUR NOTE: --")
+        self.confirm_btn.setEnabled(False)
+
+        self.rhythm_session = RhythmSession(self.detector, chart, latency=self.rhythm_offset.value() / 1000.0)
+        self.rhythm_session.start(self.frequency_source.clock())
+        self.game_active = True
+
+        if self.rhythm_timer is None:
+            self.rhythm_timer = QtCore.QTimer(self)
+            self.rhythm_timer.timeout.connect(self._rhythm_tick)
+        self.rhythm_timer.start(30)
+        self._rhythm_tick()
+
+    def _rhythm_tick(self):
+        session = self.rhythm_session
+        if session is None:
+            return
+
+        # промахи — по времени уже разобранного звука, подсказка — по текущему
+        for record in session.expire(self.frequency_source.get_result().timestamp):
+            self._show_judgement(record)
+        if session.is_finished:
+            self.finish_rhythm()
+            return
+
+        upcoming = session.upcoming(self.frequency_source.clock())
+        if upcoming:
+            note, dt = upcoming[0]
+            when = "NOW" if dt <= session.window else f"in {dt:.1f}s"
+            self.target_note.setText(f"LEVEL {self.current_level} - NEXT: {self._pitch_class(note)} {when}")
+
+    def _show_judgement(self, record):
+        if record["grade"] == "miss":
+            self.played_note.setText(f"YOUR NOTE: -- MISS ({self._pitch_class(record['note'])})")
+            return
+
+        self.played_note.setText(
+            f"YOUR NOTE: {self._pitch_class(record['played'])} "
+            f"{record['grade'].upper()} {record['offset'] * 1000:+.0f} ms"
+        )
+        self.enemy_lives_count -= 1
+        self.enemy_lives.setText(f"ENEMY HP: {self.enemy_lives_count}")
+        self._show_damage_message("Враг получил урон: -1 HP", 600)
+
+    def finish_rhythm(self):
+        session = self.rhythm_session
+        self.rhythm_timer.stop()
+        self.rhythm_session = None
+        self.game_active = False
+
+        s = session.summary()
+        c = s["counts"]
+        head = "VICTORY! " if self.enemy_lives_count <= 0 else ""
+        self.target_note.setText(
+            f"{head}HITS {s['hits']}/{s['notes']}: PERFECT {c['perfect']} GREAT {c['great']} "
+            f"GOOD {c['good']} MISS {c['miss']}"
+        )
+        if s["hits"]:
+            text = f"EARLY {s['early']} / LATE {s['late']}, MEAN {s['mean_offset'] * 1000:+.0f} ms"
+            if s["suggested_latency"] is not None:
+                text += f", OFFSET ~{s['suggested_latency'] * 1000:.0f} ms"
+            self.played_note.setText(text)
+        else:
+            self.played_note.setText("YOUR NOTE: --")
+
+        if self.enemy_lives_count <= 0:
+            QtCore.QTimer.singleShot(4000, self.return_to_level_menu)
+        else:
+            self.start_battle_btn.setText("RETRY LEVEL")
+
     def stop_game(self):
+        if self.rhythm_timer is not None:
+            self.rhythm_timer.stop()
+        self.rhythm_session = None
         self.game_active = False
         self.current_target_index = 0
         self.waiting_for_player = False
@@ -432,7 +573,7 @@ class GameWindow(QtWidgets.QWidget):
         except Exception as e:
             print(f"[ERROR] load_enemy_model: {e}")
 
-    def update_note(self):
+    def update_note(self, freq=None):
         # игра не активна или ждём подтверждения
         if not self.game_active or self.waiting_for_player:
             return
@@ -440,13 +581,24 @@ class GameWindow(QtWidgets.QWidget):
         if not self.frequency_source:
             return
 
+        # ноты приходят событиями атак (on_note_event) — по частоте не дублируем
+        if self.pitch_bridge is not None and getattr(self.frequency_source, "onsets", False):
+            return
+
         try:
-            freq = self.frequency_source.get_frequency()
+            # freq приходит сигналом от PitchSignalBridge; по таймеру — опрашиваем сами
+            if freq is None:
+                freq = self.frequency_source.get_frequency()
             if freq <= 0:
                 return
 
             now = time.time()
             if now - self.last_note_time < 0.25:
+                # по сигналу повтора может не быть (частота не менялась) — перепроверим сами
+                if self.pitch_bridge is not None and not self._recheck_pending:
+                    self._recheck_pending = True
+                    delay = int((0.25 - (now - self.last_note_time)) * 1000) + 1
+                    QtCore.QTimer.singleShot(delay, self._recheck_note)
                 return
 
             data = self.detector.detect_for_game(freq)
@@ -464,3 +616,32 @@ class GameWindow(QtWidgets.QWidget):
         except Exception as e:
             print(f"[ERROR] update_note: {e}")
 
+    def on_note_event(self, event):
+        """
+        Событие ноты от анализатора: каждая атака ("on") — отдельная сыгранная нота,
+        без паузы 0.25 с между нотами (повтор той же ноты тоже засчитывается).
+        """
+        if event.kind != "on" or not self.game_active or self.waiting_for_player:
+            return
+
+        if self.rhythm_session is not None:
+            record = self.rhythm_session.judge(event)
+            if record is not None:
+                self._show_judgement(record)
+            return
+
+        try:
+            data = self.detector.detect_for_game(event.frequency)
+            if not data:
+                return
+
+            self.last_note_time = time.time()
+            self.check_note(data["note"], float(data.get("cents", 0.0)))
+
+        except Exception as e:
+            print(f"[ERROR] on_note_event: {e}")
+
+    def _recheck_note(self):
+        self._recheck_pending = False
+        self.update_note()
+
@@ -0,0 +1,153 @@
+# instrumentation.py
+import bisect
+import threading
+import time
+
+
+# Границы корзин гистограммы, мкс: 1 мкс .. ~1 с, 4 корзины на октаву (шаг ~19%)
+_EDGES_US = [2.0 ** (i / 4.0) for i in range(0, 81)]
+
+
+class StageHistogram:
+    """
+    Гистограмма длительностей одной стадии конвейера.
+    add() — bisect по фиксированным границам + пара сложений, без выделения памяти,
+    так что её можно звать на каждом кадре и даже в audio callback.
+    """
+
+    __slots__ = ("counts", "count", "total_us", "max_us")
+
+    def __init__(self):
+        self.counts = [0] * (len(_EDGES_US) + 1)
+        self.count = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        self.counts[bisect.bisect_left(_EDGES_US, us)] += 1
+        self.count += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def percentile(self, q, counts=None, count=None):
+        """Оценка q-го перцентиля (мкс) по верхней границе корзины (не выше максимума)."""
+        counts = self.counts if counts is None else counts
+        count = self.count if count is None else count
+        if count <= 0:
+            return 0.0
+        need = q / 100.0 * count
+        acc = 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= need and c:
+                return min(_EDGES_US[i], self.max_us) if i < len(_EDGES_US) else self.max_us
+        return self.max_us
+
+    def summary(self):
+        # копия, чтобы поток анализа не менял счётчики посреди подсчёта
+        counts = list(self.counts)
+        count = sum(counts)
+        return {
+            "count": count,
+            "mean_us": self.total_us / count if count else 0.0,
+            "p50_us": self.percentile(50, counts, count),
+            "p95_us": self.percentile(95, counts, count),
+            "p99_us": self.percentile(99, counts, count),
+            "max_us": self.max_us,
+        }
+
+
+class Instrumentation:
+    """
+    Счётчики и тайминги горячего пути анализатора.
+    Пишут callback PortAudio и поток анализа, читает UI (snapshot) — без блокировок
+    на записи: потерять одно инкрементирование при гонке не страшно, тормозить callback нельзя.
+    enabled = False выключает тайминги (счётчики и исключения считаются всегда).
+    """
+
+    # флаги sounddevice.CallbackFlags
+    STATUS_FLAGS = ("input_overflow", "input_underflow", "output_overflow", "output_underflow", "priming_output")
+
+    def __init__(self, enabled=True):
+        self.enabled = bool(enabled)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+            self.exceptions = {}
+            self.status_flags = dict.fromkeys(self.STATUS_FLAGS, 0)
+            self.last_exception = ""
+            self.last_status = ""
+            self.started = time.time()
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages.setdefault(stage, StageHistogram())
+        hist.add(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def exception(self, exc, where=""):
+        name = type(exc).__name__
+        self.exceptions[name] = self.exceptions.get(name, 0) + 1
+        self.last_exception = f"{where}: {name}: {exc}" if where else f"{name}: {exc}"
+
+    def status(self, status):
+        """Флаги статуса PortAudio из callback (sounddevice.CallbackFlags)."""
+        if not status:
+            return
+        flags = self.status_flags
+        for name in self.STATUS_FLAGS:
+            if getattr(status, name, False):
+                flags[name] += 1
+        self.last_status = str(status)
+
+    def snapshot(self):
+        """Срез для UI/логов: обычные dict, безопасно читать из любого потока."""
+        with self._lock:
+            stages = {name: hist.summary() for name, hist in list(self.stages.items())}
+            return {
+                "uptime_s": time.time() - self.started,
+                "stages": stages,
+                "counters": dict(self.counters),
+                "exceptions": dict(self.exceptions),
+                "last_exception": self.last_exception,
+                "status_flags": dict(self.status_flags),
+                "last_status": self.last_status,
+            }
+
+
+def format_snapshot(snap, stages_order=None):
+    """Короткий многострочный текст для отладочного оверлея."""
+    lines = []
+    stages = snap.get("stages", {})
+    order = list(stages_order or []) + sorted(k for k in stages if k not in (stages_order or []))
+    for name in order:
+        s = stages.get(name)
+        if not s or not s["count"]:
+            continue
+        lines.append(f"{name:<11} p50 {s['p50_us']:7.0f}  p95 {s['p95_us']:7.0f}  max {s['max_us']:7.0f} us")
+
+    counters = snap.get("counters", {})
+    if counters:
+        lines.append("  ".join(f"{k}={v}" for k, v in sorted(counters.items())))
+
+    flags = {k: v for k, v in snap.get("status_flags", {}).items() if v}
+    if flags:
+        lines.append("PortAudio: " + "  ".join(f"{k}={v}" for k, v in flags.items()))
+
+    exceptions = snap.get("exceptions", {})
+    if exceptions:
+        lines.append("errors: " + "  ".join(f"{k}={v}" for k, v in sorted(exceptions.items())))
+        if snap.get("last_exception"):
+            lines.append(snap["last_exception"][:120])
+    return "\n".join(lines)
@@ -3,6 +3,7 @@ import math
 from PyQt5 import QtWidgets, QtCore
 from audio_settings_window import AudioSettingsWindow
 from library import LibraryController
+from instrumentation import format_snapshot
 
 
 try:
@@ -12,6 +13,8 @@ try:
     from database import UserDatabase
     from login_window import LoginWindow
     from tuning_window import TuningWindow
+    from pitch_signal import PitchSignalBridge
+    from tuning_session import TuningSession
 except ImportError as e:
     print(f"Import error: {e}")
     sys.exit(1)
@@ -63,18 +66,28 @@ class GuitarTunerApp(QtWidgets.QMainWindow):
             # Настраиваем тунерские полосы
             self.setup_tuner_bars()
 
+            # Отладочный оверлей с таймингами анализатора (F3)
+            self.setup_debug_overlay()
+
+            # Пошаговая настройка по струнам активного строя
+            self.setup_tuning_session_button()
+
+            # Режим аккордов: вместо одной ноты — название трезвучия
+            self.setup_chord_button()
+
+            # Самые громкие ноты кадра под кнопками
+            self.setup_note_levels_label()
+
             # Настраиваем соединения кнопок
             self.setup_connections()
 
             # Настраиваем переключение окон
             self.setup_window_switching()
 
-            # Таймер для обновления интерфейса тюнера
+            # Обновление тюнера: анализатор сам присылает новую частоту (сигнал),
+            # таймер опроса — запасной вариант
             if self.frequency_analisator:
-                self.timer = QtCore.QTimer(self)
-                self.timer.timeout.connect(self.update_ui)
-                self.timer.start(100)  # 10 раз в секунду
-                print("Таймер тюнера запущен")
+                self.setup_pitch_updates()
 
         except Exception as e:
             print(f"Ошибка инициализации приложения: {e}")
@@ -89,12 +102,38 @@ class GuitarTunerApp(QtWidgets.QMainWindow):
                 QtWidgets.QMessageBox.warning(self, "Ошибка", "Пользователь не авторизован")
                 return
 
-            dialog = TuningWindow(self.db_manager, self.user_id, self)
+            dialog = TuningWindow(self.db_manager, self.user_id, self,
+                                  active_tuning=getattr(self, "active_tuning", None))
             dialog.exec_()
+            self.set_active_tuning(dialog.get_selected_tuning())
 
         except Exception as e:
             print(f"Ошибка открытия окна строя: {e}")
 
+    def set_active_tuning(self, tuning):
+        """
+        Строй, по которому работает тюнер: ноты сравниваются только с его струнами
+        (NoteDetector.set_strings). None — хроматический режим.
+        """
+        if getattr(self, "note_detecter", None) is None:
+            self.active_tuning = tuning
+            return
+        try:
+            self.note_detecter.set_strings(tuning['strings'] if tuning else None)
+        except ValueError as e:
+            # нота строя не разобралась: тюнер остаётся на прежнем строе
+            print(f"[TUNER] Строй не применён: {e}")
+            QtWidgets.QMessageBox.warning(self, "Ошибка", f"Строй не применён: {e}")
+            if tuning is getattr(self, "active_tuning", None):
+                # запомненный до создания детектора строй — детектор остался хроматическим
+                self.active_tuning = None
+            return
+        self.active_tuning = tuning
+        if tuning:
+            print(f"[TUNER] Строй: {tuning['name']} ({' '.join(tuning['strings'])})")
+        else:
+            print("[TUNER] Хроматический режим")
+
     def init_library(self):
         """
         Подключаем LibraryController к library_ui.
@@ -188,6 +227,74 @@ class GuitarTunerApp(QtWidgets.QMainWindow):
         except Exception as e:
             print(f"Ошибка настройки полос тюнера: {e}")
 
+    def setup_pitch_updates(self):
+        try:
+            if getattr(self, "pitch_bridge", None) is None:
+                self.pitch_bridge = PitchSignalBridge(parent=self)
+                self.pitch_bridge.result_changed.connect(self.on_pitch_result)
+            self.pitch_bridge.attach(self.frequency_analisator)
+            if hasattr(self, 'timer'):
+                self.timer.stop()
+            print("Тюнер подписан на анализатор")
+        except Exception as e:
+            print(f"Подписка на анализатор недоступна ({e}), включаю опрос по таймеру")
+            if not hasattr(self, 'timer'):
+                self.timer = QtCore.QTimer(self)
+                self.timer.timeout.connect(self.update_ui)
+            self.timer.start(100)  # 10 раз в секунду
+            print("Таймер тюнера запущен")
+
+    def setup_debug_overlay(self):
+        """
+        Полупрозрачная панель поверх тюнера: тайминги стадий, отброшенные кадры,
+        исключения и флаги PortAudio (Analisador.get_instrumentation).
+        Показывается/прячется по F3, обновляется только пока видна.
+        """
+        try:
+            parent = getattr(self.ui, "main_window", None) or self
+            self.debug_overlay = QtWidgets.QLabel(parent)
+            self.debug_overlay.setGeometry(QtCore.QRect(10, 400, 620, 190))
+            self.debug_overlay.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop)
+            self.debug_overlay.setStyleSheet(
+                "color: rgb(0, 255, 0); background-color: rgba(0, 0, 0, 170); font: 8pt 'Consolas'; padding: 4px;")
+            self.debug_overlay.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+            self.debug_overlay.hide()
+
+            self.debug_timer = QtCore.QTimer(self)
+            self.debug_timer.timeout.connect(self.update_debug_overlay)
+
+            shortcut = QtWidgets.QShortcut(QtCore.Qt.Key_F3, self)
+            shortcut.activated.connect(self.toggle_debug_overlay)
+        except Exception as e:
+            print(f"Ошибка создания отладочного оверлея: {e}")
+
+    def toggle_debug_overlay(self):
+        overlay = getattr(self, "debug_overlay", None)
+        if overlay is None:
+            return
+        if overlay.isVisible():
+            self.debug_timer.stop()
+            overlay.hide()
+        else:
+            self.update_debug_overlay()
+            overlay.show()
+            overlay.raise_()
+            self.debug_timer.start(500)
+
+    def update_debug_overlay(self):
+        try:
+            if not self.frequency_analisator:
+                self.debug_overlay.setText("анализатор не запущен")
+                return
+
+            snap = self.frequency_analisator.get_instrumentation()
+            stream = snap["stream"]
+            head = (f"engine={stream['engine']}  window={stream['window']}  hop={stream['hop_ms']:.1f} ms  "
+                    f"load={stream['analysis_load']:.2f}  latency={stream['latency_ms_avg']:.1f} ms")
+            self.debug_overlay.setText(head + "\n" + format_snapshot(snap, snap["stage_order"]))
+        except Exception as e:
+            self.debug_overlay.setText(f"Ошибка инструментирования: {e}")
+
     def setup_connections(self):
         """
         pushButton (иконка сверху слева) = открыть настройки аудио
@@ -226,20 +333,26 @@ class GuitarTunerApp(QtWidgets.QMainWindow):
 
         device = dialog.get_selected_device()
         ch_index = dialog.get_selected_channel_index()
+        engine = dialog.get_selected_engine()
 
-        print(f"[SETTINGS] sounddevice device={device}, channel_index={ch_index}")
+        print(f"[SETTINGS] sounddevice device={device}, channel_index={ch_index}, engine={engine}")
 
         if device is None:
             return
 
         if getattr(self, "note_detecter", None) is None:
             self.note_detecter = NoteDetector()
+            self.set_active_tuning(getattr(self, "active_tuning", None))
 
         if getattr(self, "frequency_analisator", None) is None:
-            self.frequency_analisator = Analisador(device=device, channel_index=ch_index)
+            self.frequency_analisator = Analisador(device=device, channel_index=ch_index, engine=engine)
+            if getattr(self, "note_levels_label", None) is not None:
+                self.frequency_analisator.set_note_levels(True)
             self.frequency_analisator.start()
         else:
-            self.frequency_analisator.reconfigure(device=device, channel_index=ch_index)
+            self.frequency_analisator.reconfigure(device=device, channel_index=ch_index, engine=engine)
+
+        self.setup_pitch_updates()
 
         if hasattr(self.ui, "game_window"):
             self.ui.game_window.set_frequency_source(self.frequency_analisator)
@@ -254,46 +367,48 @@ class GuitarTunerApp(QtWidgets.QMainWindow):
         except:
             return 0
 
-    def update_ui(self):
+    def on_pitch_result(self, result):
+        self.update_ui(result)
+
+    def update_ui(self, result=None):
         try:
             if not self.frequency_analisator:
                 return
 
-            frequency = self.frequency_analisator.get_frequency()
+            # result (PitchResult) приходит из сигнала PitchSignalBridge; без него — опрос
+            if result is None:
+                result = self.frequency_analisator.get_result()
+            frequency = result.frequency
+            self.show_note_levels()
+
+            # в режиме аккордов экран обновляет свой таймер (update_chord_display)
+            if getattr(self, "chord_btn", None) is not None and self.chord_btn.isChecked():
+                return
+
+            # пошаговая настройка по струнам ведёт экран сама
+            session = getattr(self, "tuning_session", None)
+            if session is not None and session.is_active:
+                self.update_tuning_session(session, result)
+                return
 
             if frequency > 0:
-                data = self.note_detecter.detect_full(frequency)
+                # со строем — только его струны, без строя — ближайшая хроматическая нота
+                if getattr(self, "active_tuning", None):
+                    data = self.note_detecter.detect_string(frequency, result.confidence)
+                else:
+                    data = self.note_detecter.detect_full(frequency, result.confidence)
                 if not data:
                     self.show_no_signal()
                     return
 
                 note = data["note"]
                 cents_diff = data["cents"]
+                if "string" in data:
+                    # номер струны и её нота, например "5:A2"
+                    note = f"{data['string']}:{note}"
 
                 if note:
-                    # cents уже корректный, с учётом октавы
-                    try:
-                        self.ui.label_4.setText(note)
-                    except:
-                        pass
-
-                    GREEN_ZONE = 12
-                    YELLOW_ZONE = 30
-
-                    if abs(cents_diff) <= GREEN_ZONE:
-                        self.update_bars(0, 0, "rgb(0, 255, 0)")
-                    elif cents_diff < 0:
-                        cents_value = min(50, abs(int(cents_diff)))
-                        self.update_bars(
-                            cents_value, 0,
-                            "rgb(255, 255, 0)" if abs(cents_diff) <= YELLOW_ZONE else "rgb(255, 69, 0)"
-                        )
-                    else:
-                        cents_value = min(50, abs(int(cents_diff)))
-                        self.update_bars(
-                            0, cents_value,
-                            "rgb(255, 255, 0)" if abs(cents_diff) <= YELLOW_ZONE else "rgb(255, 69, 0)"
-                        )
+                    self.show_note(note, cents_diff)
                 else:
                     self.show_no_signal()
             else:
@@ -303,6 +418,176 @@ class GuitarTunerApp(QtWidgets.QMainWindow):
             print(f"Ошибка обновления UI тюнера: {e}")
             self.show_no_signal()
 
+    def show_note(self, note, cents_diff):
+        # cents уже корректный, с учётом октавы
+        try:
+            self.ui.label_4.setText(note)
+        except:
+            pass
+
+        GREEN_ZONE = 12
+        YELLOW_ZONE = 30
+
+        if abs(cents_diff) <= GREEN_ZONE:
+            self.update_bars(0, 0, "rgb(0, 255, 0)")
+        elif cents_diff < 0:
+            cents_value = min(50, abs(int(cents_diff)))
+            self.update_bars(
+                cents_value, 0,
+                "rgb(255, 255, 0)" if abs(cents_diff) <= YELLOW_ZONE else "rgb(255, 69, 0)"
+            )
+        else:
+            cents_value = min(50, abs(int(cents_diff)))
+            self.update_bars(
+                0, cents_value,
+                "rgb(255, 255, 0)" if abs(cents_diff) <= YELLOW_ZONE else "rgb(255, 69, 0)"
+            )
+
+    # ================= НАСТРОЙКА ПО СТРУНАМ =================
+    def setup_tuning_session_button(self):
+        """Кнопка "По струнам" на экране тюнера: запускает/останавливает TuningSession."""
+        try:
+            parent = getattr(self.ui, "main_window", None) or self
+            self.session_btn = QtWidgets.QPushButton("По струнам", parent)
+            # под кнопкой "Аккорды": правая колонка занята label_3/label_6
+            self.session_btn.setGeometry(QtCore.QRect(470, 210, 131, 41))
+            self.session_btn.setCheckable(True)
+            self.session_btn.setStyleSheet(
+                "QPushButton { color: rgb(0, 170, 0); background-color: rgb(36, 36, 36); "
+                "font: 10pt 'MS Serif'; border: 3px solid #00aa00; }"
+                "QPushButton:checked { background-color: rgb(0, 100, 0); color: white; }")
+            self.session_btn.toggled.connect(self.on_tuning_session_toggled)
+            self.tuning_session = None
+        except Exception as e:
+            print(f"Ошибка создания кнопки настройки по струнам: {e}")
+
+    def on_tuning_session_toggled(self, checked):
+        if not checked:
+            if self.tuning_session is not None and self.tuning_session.is_active:
+                print("[TUNER] Настройка по струнам остановлена")
+            self.tuning_session = None
+            self.show_no_signal()
+            return
+
+        tuning = getattr(self, "active_tuning", None)
+        if not tuning or getattr(self, "note_detecter", None) is None:
+            QtWidgets.QMessageBox.information(self, "Настройка по струнам",
+                                              "Сначала выберите строй (кнопка аккаунта).")
+            self.session_btn.setChecked(False)
+            return
+
+        if getattr(self, "chord_btn", None) is not None:
+            self.chord_btn.setChecked(False)
+
+        try:
+            self.tuning_session = TuningSession(self.note_detecter, tuning['strings'])
+        except ValueError as e:
+            # исключение из слота Qt без excepthook закрыло бы приложение
+            print(f"[TUNER] Настройка по струнам недоступна: {e}")
+            QtWidgets.QMessageBox.warning(self, "Настройка по струнам", f"Строй не подходит: {e}")
+            self.session_btn.setChecked(False)
+            return
+        self.tuning_session.start()
+        print(f"[TUNER] Настройка по струнам: {tuning['name']}")
+
+    def update_tuning_session(self, session, result):
+        state = session.update(result)
+        if state is None:
+            return
+
+        text = f"{state['string']}:{state['note']}"
+        if state["locked"]:
+            print(f"[TUNER] Струна {state['string']} ({state['note']}) настроена за "
+                  f"{session.records[-1]['time_to_lock']:.1f} с")
+
+        if state["finished"]:
+            summary = session.summary()
+            print(f"[TUNER] Все струны настроены за {summary['total_time']:.1f} с")
+            self.session_btn.setChecked(False)
+            self.ui.label_4.setText("OK")
+            self.update_bars(0, 0, "rgb(0, 255, 0)")
+            return
+
+        if state["locked"]:
+            # следующая струна: показываем её, пока не сыграли
+            number, note, _ = session.current()
+            self.ui.label_4.setText(f"{number}:{note}")
+            self.update_bars(0, 0, "rgb(0, 255, 0)")
+        elif state["cents"] is None:
+            self.show_no_signal()
+            self.ui.label_4.setText(text)
+        else:
+            self.show_note(text, state["cents"])
+
+    # ================= АККОРДЫ =================
+    def setup_chord_button(self):
+        """Кнопка "Аккорды": включает ChordDetector в анализаторе и показывает аккорд вместо ноты."""
+        try:
+            parent = getattr(self.ui, "main_window", None) or self
+            self.chord_btn = QtWidgets.QPushButton("Аккорды", parent)
+            self.chord_btn.setGeometry(QtCore.QRect(470, 160, 131, 41))
+            self.chord_btn.setCheckable(True)
+            self.chord_btn.setStyleSheet(
+                "QPushButton { color: rgb(0, 170, 0); background-color: rgb(36, 36, 36); "
+                "font: 10pt 'MS Serif'; border: 3px solid #00aa00; }"
+                "QPushButton:checked { background-color: rgb(0, 100, 0); color: white; }")
+            self.chord_btn.toggled.connect(self.on_chords_toggled)
+
+            # аккорд меняется и тогда, когда частота ноты стоит на месте — поэтому опрос, а не подписка
+            self.chord_timer = QtCore.QTimer(self)
+            self.chord_timer.timeout.connect(self.update_chord_display)
+        except Exception as e:
+            print(f"Ошибка создания кнопки аккордов: {e}")
+
+    def on_chords_toggled(self, checked):
+        if self.frequency_analisator is None:
+            self.chord_btn.setChecked(False)
+            return
+
+        if checked and getattr(self, "session_btn", None) is not None:
+            self.session_btn.setChecked(False)
+
+        self.frequency_analisator.set_chords(checked)
+        if checked:
+            self.chord_timer.start(100)
+        else:
+            self.chord_timer.stop()
+            self.show_no_signal()
+
+    def update_chord_display(self):
+        try:
+            chord = self.frequency_analisator.get_chord()
+            if not chord or not chord["chord"]:
+                self.show_no_signal()
+                return
+            self.ui.label_4.setText(chord["chord"])
+            self.update_bars(0, 0, "rgb(0, 255, 0)")
+        except Exception as e:
+            print(f"Ошибка обновления аккорда: {e}")
+
+    # ================= УРОВНИ НОТ =================
+    def setup_note_levels_label(self):
+        """Строка под кнопками: самые громкие ноты кадра (constant-Q по нотам) — видно, что ещё звенит."""
+        try:
+            parent = getattr(self.ui, "main_window", None) or self
+            self.note_levels_label = QtWidgets.QLabel("", parent)
+            self.note_levels_label.setGeometry(QtCore.QRect(470, 260, 131, 41))
+            self.note_levels_label.setAlignment(QtCore.Qt.AlignCenter)
+            self.note_levels_label.setStyleSheet("color: rgb(0, 170, 0); font: 9pt 'MS Serif';")
+            if self.frequency_analisator is not None:
+                self.frequency_analisator.set_note_levels(True)
+        except Exception as e:
+            print(f"Ошибка создания строки уровней нот: {e}")
+
+    def show_note_levels(self):
+        label = getattr(self, "note_levels_label", None)
+        if label is None:
+            return
+        # самая громкая первой, остальные — с уровнем в процентах от неё
+        levels = self.frequency_analisator.get_note_levels()
+        label.setText("  ".join(note if i == 0 else f"{note} {int(level * 100)}%"
+                                for i, (note, level) in enumerate(levels)))
+
     def update_bars(self, low_value, high_value, color):
         try:
             self.ui.tunerBar_low.setValue(low_value)
@@ -322,12 +607,16 @@ class GuitarTunerApp(QtWidgets.QMainWindow):
 
     def closeEvent(self, event):
         try:
+            if getattr(self, 'pitch_bridge', None) is not None:
+                self.pitch_bridge.detach()
             if self.frequency_analisator:
                 print("Останавливаю анализ частоты...")
                 self.frequency_analisator.stop_analysis()
             if hasattr(self, 'timer'):
                 print("Останавливаю таймер...")
                 self.timer.stop()
+            if hasattr(self, 'debug_timer'):
+                self.debug_timer.stop()
         except Exception as e:
             print(f"Ошибка при закрытии: {e}")
         event.accept()
@@ -1,40 +1,270 @@
 # note_detecter.py
+import bisect
+import functools
+import math
+
 import numpy as np
 
+PITCH_CLASSES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+_FLATS = {'Db': 'C#', 'Eb': 'D#', 'Gb': 'F#', 'Ab': 'G#', 'Bb': 'A#'}
+
+# Ступени строя от C (отношения частот), A4 задаётся отдельно (reference)
+TEMPERAMENTS = {
+    "equal": [2.0 ** (i / 12.0) for i in range(12)],
+    "pythagorean": [1.0, 256 / 243, 9 / 8, 32 / 27, 81 / 64, 4 / 3,
+                    729 / 512, 3 / 2, 128 / 81, 27 / 16, 16 / 9, 243 / 128],
+    "just": [1.0, 16 / 15, 9 / 8, 6 / 5, 5 / 4, 4 / 3,
+             45 / 32, 3 / 2, 8 / 5, 5 / 3, 9 / 5, 15 / 8],
+    # Werckmeister III, в центах
+    "werckmeister": [2.0 ** (c / 1200.0) for c in (0.0, 90.225, 192.18, 294.135, 390.225, 498.045,
+                                                  588.27, 696.09, 792.18, 888.27, 996.09, 1092.18)],
+}
+
+A4_MIN, A4_MAX = 430.0, 450.0
+RANGE_LOW, RANGE_HIGH = 'B0', 'E6'
+
+# Исходная таблица (A4 = 440, равномерный строй, E2..E5) — остаётся как есть,
+# чтобы по умолчанию результаты не менялись ни на сотую герца
+DEFAULT_TABLE = {
+    'E2': 82.41, 'F2': 87.31, 'F#2': 92.50, 'G2': 98.00,
+    'G#2': 103.83, 'A2': 110.00, 'A#2': 116.54, 'B2': 123.47,
+    'C3': 130.81, 'C#3': 138.59, 'D3': 146.83, 'D#3': 155.56,
+    'E3': 164.81, 'F3': 174.61, 'F#3': 185.00, 'G3': 196.00,
+    'G#3': 207.65, 'A3': 220.00, 'A#3': 233.08, 'B3': 246.94,
+    'C4': 261.63, 'C#4': 277.18, 'D4': 293.66, 'D#4': 311.13,
+    'E4': 329.63, 'F4': 349.23, 'F#4': 369.99, 'G4': 392.00,
+    'G#4': 415.30, 'A4': 440.00, 'A#4': 466.16, 'B4': 493.88,
+    'C5': 523.25, 'C#5': 554.37, 'D5': 587.33, 'D#5': 622.25,
+    'E5': 659.25
+}
+
+# Сколько наборов таблиц держать в кэше (note_tables): A4 подстраивают на ходу, каждое значение — свой набор
+TABLES_CACHE_SIZE = 16
+
+
+def parse_note(note):
+    """'E2' / 'F#3' / 'Bb1' -> (класс 0..11, октава). ValueError, если имя не разобрать."""
+    name = str(note).strip()
+    i = 1
+    if len(name) > 1 and name[1] in '#b':
+        i = 2
+    pitch, octave = name[:i], name[i:]
+    pitch = _FLATS.get(pitch, pitch)
+    try:
+        return PITCH_CLASSES.index(pitch.upper() if len(pitch) == 1 else pitch), int(octave)
+    except ValueError:
+        raise ValueError(f"Неизвестная нота: {note}")
+
+
+def note_frequency(note, a4=440.0, temperament="equal"):
+    """Частота ноты в заданном строе: ступень строя от C, нормированная так, что A4 = a4."""
+    ratios = TEMPERAMENTS.get(temperament)
+    if ratios is None:
+        raise ValueError(f"Неизвестный строй: {temperament}")
+    pc, octave = parse_note(note)
+    return float(a4) * (ratios[pc] / ratios[9]) * 2.0 ** (octave - 4)
+
+
+class _NoteTables:
+    """Таблица нот и всё, что detect/detect_batch считают по ней заранее (неизменяемо после сборки)."""
+
+    __slots__ = ("frequencies", "note_names", "log2_a4", "table_freqs", "table_log2",
+                 "candidates", "cand_index", "cand_freqs", "cand_log2", "cand_classes")
+
+    def __init__(self, frequencies, a4):
+        """
+        Для каждого звуковысотного класса (0 = C ... 11 = B) заранее собраны записи таблицы
+        соседних классов (класс-1, класс, класс+1) в исходном порядке: (имя, частота, log2 частоты, класс).
+        """
+        self.frequencies = dict(frequencies)
+        self.note_names = list(self.frequencies)
+        self.log2_a4 = math.log2(float(a4))
+        self.table_freqs = np.array(list(self.frequencies.values()), dtype=np.float64)
+        self.table_log2 = np.log2(self.table_freqs)
+
+        by_class = [[] for _ in range(12)]
+        for index, (note, note_freq) in enumerate(self.frequencies.items()):
+            pc, _ = parse_note(note)
+            by_class[pc].append((index, note, float(note_freq)))
+
+        self.candidates = []
+        cand_index = []
+        for pc in range(12):
+            near = sorted(by_class[(pc - 1) % 12] + by_class[pc] + by_class[(pc + 1) % 12])
+            self.candidates.append(tuple((note, f, math.log2(f), parse_note(note)[0]) for _, note, f in near))
+            cand_index.append([index for index, _, _ in near])
+
+        # то же для detect_batch: (12 x L) номеров записей, хвост дополнен фиктивной записью
+        # с бесконечной частотой (она никогда не проходит допуск)
+        width = max(len(row) for row in cand_index)
+        pad = len(self.note_names)
+        self.cand_index = np.array([row + [pad] * (width - len(row)) for row in cand_index], dtype=np.int64)
+        self.cand_freqs = np.append(self.table_freqs, np.inf)
+        self.cand_log2 = np.append(self.table_log2, np.inf)
+        self.cand_classes = np.array([parse_note(note)[0] for note in self.note_names] + [-1], dtype=np.int64)
+
+
+def note_tables(a4=440.0, temperament="equal", low='E2', high='E5'):
+    """
+    Таблицы для (a4, temperament, low..high) — строятся один раз и дальше берутся из кэша.
+    A4 округляется до 0.01 Гц: иначе каждый шаг ползунка давал бы новый ключ.
+    """
+    a4 = round(float(a4), 2)
+    if not A4_MIN <= a4 <= A4_MAX:
+        raise ValueError(f"A4 должна быть в пределах {A4_MIN:.0f}..{A4_MAX:.0f} Гц: {a4}")
+    if temperament not in TEMPERAMENTS:
+        raise ValueError(f"Неизвестный строй: {temperament}")
+
+    lo_pc, lo_oct = parse_note(low)
+    hi_pc, hi_oct = parse_note(high)
+    first, last = lo_oct * 12 + lo_pc, hi_oct * 12 + hi_pc
+    min_pc, min_oct = parse_note(RANGE_LOW)
+    max_pc, max_oct = parse_note(RANGE_HIGH)
+    if first < min_oct * 12 + min_pc or last > max_oct * 12 + max_pc or last - first < 12:
+        raise ValueError(f"Диапазон {low}..{high}: нужно не меньше октавы в пределах {RANGE_LOW}..{RANGE_HIGH}")
+
+    return _build_tables(a4, temperament, first, last)
+
+
+@functools.lru_cache(maxsize=TABLES_CACHE_SIZE)
+def _build_tables(a4, temperament, first, last):
+    if (a4, temperament, first, last) == _DEFAULT_KEY:
+        frequencies = DEFAULT_TABLE
+    else:
+        frequencies = {}
+        for n in range(first, last + 1):
+            note = f"{PITCH_CLASSES[n % 12]}{n // 12}"
+            frequencies[note] = note_frequency(note, a4, temperament)
+    return _NoteTables(frequencies, a4)
+
+
+_DEFAULT_KEY = (440.0, "equal", 2 * 12 + 4, 5 * 12 + 4)  # E2..E5
+
+
 class NoteDetector:
-    def __init__(self):
-        # все ноты с частотой
-        self.guitar_frequencies = {
-            'E2': 82.41, 'F2': 87.31, 'F#2': 92.50, 'G2': 98.00,
-            'G#2': 103.83, 'A2': 110.00, 'A#2': 116.54, 'B2': 123.47,
-            'C3': 130.81, 'C#3': 138.59, 'D3': 146.83, 'D#3': 155.56,
-            'E3': 164.81, 'F3': 174.61, 'F#3': 185.00, 'G3': 196.00,
-            'G#3': 207.65, 'A3': 220.00, 'A#3': 233.08, 'B3': 246.94,
-            'C4': 261.63, 'C#4': 277.18, 'D4': 293.66, 'D#4': 311.13,
-            'E4': 329.63, 'F4': 349.23, 'F#4': 369.99, 'G4': 392.00,
-            'G#4': 415.30, 'A4': 440.00, 'A#4': 466.16, 'B4': 493.88,
-            'C5': 523.25, 'C#5': 554.37, 'D5': 587.33, 'D#5': 622.25,
-            'E5': 659.25
-        }
+    def __init__(self, a4=440.0, temperament="equal", low='E2', high='E5'):
+        # Режим "по струнам" (set_strings): ноты струн строя и индекс их частот
+        self.string_notes = []
+        self._string_index = None
+        # дальше этого от ближайшей струны (в cents) ноту не засчитываем
+        self.string_max_cents = 600.0
+
+        # все ноты с частотой (по умолчанию — исходная таблица E2..E5 при A4 = 440)
+        self.set_reference(a4, temperament, low, high)
+
+    def set_reference(self, a4=None, temperament=None, low=None, high=None):
+        """
+        Сменить эталон A4 (430..450 Гц), строй (TEMPERAMENTS) и/или диапазон нот (B0..E6).
+        Не переданное остаётся прежним. Таблицы кэшируются: повторное переключение бесплатно.
+        """
+        current = getattr(self, "_reference", (440.0, "equal", 'E2', 'E5'))
+        a4 = round(float(current[0] if a4 is None else a4), 2)
+        temperament = current[1] if temperament is None else str(temperament).lower()
+        low = current[2] if low is None else low
+        high = current[3] if high is None else high
+
+        tables = note_tables(a4, temperament, low, high)
+        self._reference = (a4, temperament, low, high)
+        self.a4 = a4
+        self.temperament = temperament
+
+        self._tables = tables
+        self.guitar_frequencies = tables.frequencies
+        self.note_names = tables.note_names
+        self._log2_a4 = tables.log2_a4
+        self._table_freqs = tables.table_freqs
+        self._table_log2 = tables.table_log2
+        self._candidates = tables.candidates
+        self._cand_index = tables.cand_index
+        self._cand_freqs = tables.cand_freqs
+        self._cand_log2 = tables.cand_log2
+        self._cand_classes = tables.cand_classes
+
+        # цели струн зависят от A4 и строя — пересчитываем
+        if self.string_notes:
+            self.set_strings(self.string_notes)
+
+    def set_strings(self, notes):
+        """
+        Режим "по струнам": notes — ноты строя от 6-й (толстой) струны к 1-й, как в guitar_tunings.
+        Частоты струн считаются один раз (при текущих A4 и строе) и хранятся отсортированными по log2:
+        detect_string ищет ближайшую струну бинарным поиском. None / [] — обратно к хроматике.
+        """
+        if not notes:
+            self.string_notes = []
+            self._string_index = None
+            return
+
+        notes = [str(n).strip() for n in notes]
+        freqs = [self.note_to_frequency(n) for n in notes]
+        count = len(notes)
+        order = sorted(range(count), key=lambda i: freqs[i])
+
+        self.string_notes = notes
+        self._string_index = (
+            [math.log2(freqs[i]) for i in order],
+            [(count - i, notes[i], freqs[i]) for i in order],  # (номер струны, нота, частота)
+        )
+
+    def detect_string(self, freq, confidence=None):
+        """
+        Ближайшая струна текущего строя (см. set_strings).
+        Возвращает dict: {"string": номер струны (6 — толстая), "note": str, "target": float,
+                          "cents": float, "confidence": float, "octave": int}
+        или None, если строй не задан или до ближайшей струны дальше string_max_cents.
+        Сравнение только со струнами строя: струна, расстроенная больше чем на полутон,
+        всё равно остаётся "своей", а не соседней хроматической нотой.
+        """
+        if self._string_index is None or not 0 < freq < float('inf'):
+            return None
+
+        logs, strings = self._string_index
+        lf = math.log2(freq)
+        i = bisect.bisect_left(logs, lf)
+        if i == len(logs) or (i > 0 and lf - logs[i - 1] <= logs[i] - lf):
+            i -= 1
+
+        cents = 1200.0 * (lf - logs[i])
+        if abs(cents) > self.string_max_cents:
+            return None
+
+        number, note, target = strings[i]
+        if confidence is None:
+            confidence = max(0.0, 1.0 - (abs(cents) / 50.0))
+        confidence = min(1.0, max(0.0, float(confidence)))
+
+        return {"string": number, "note": note, "target": float(target), "cents": float(cents),
+                "confidence": confidence, "octave": parse_note(note)[1]}
+
+    def note_to_frequency(self, note):
+        """Частота любой ноты (не только из таблицы) при текущих A4 и строе."""
+        return note_frequency(note, self.a4, self.temperament)
 
     def detect(self, freq):
-        if freq <= 0:
+        if not 0 < freq < float('inf'):
             return None
-        # ищем ближайшую ноту с проверкой ±1 октаву
+        # Ближайшая нота с проверкой ±1 октаву.
+        # Ближе 10 Гц может оказаться только ближайший полутон снизу или сверху,
+        # поэтому смотрим лишь записи соседних классов, а не всю таблицу.
+        lf = math.log2(freq)
+        pc = (int(round(12 * (lf - self._log2_a4))) + 9) % 12
+        candidates = self._candidates[pc]
+
+        # Класс — по записи, ближайшей к freq после переноса в ближайшую к freq октаву
+        # (ldexp умножает на 2^k без округления); вне диапазона таблицы так находится нота выше/ниже неё
         min_diff = float('inf')
-        closest_note = None
-        for note, note_freq in self.guitar_frequencies.items():
-            # коррекция октав
-            while note_freq * 2 < freq:
-                note_freq *= 2
-            while note_freq / 2 > freq:
-                note_freq /= 2
-
-            diff = abs(freq - note_freq)
+        closest_class = None
+        for note, note_freq, lv, cls in candidates:
+            diff = abs(freq - math.ldexp(note_freq, round(lf - lv)))
             if diff < min_diff and diff < 10:  # tolerance в Гц
                 min_diff = diff
-                closest_note = note
-        return closest_note
+                closest_class = cls
+        if closest_class is None:
+            return None
+
+        # Имя — запись этого класса, ближайшая по log2: внутри таблицы это нота своей октавы
+        # (у класса несколько записей — A1..A5 на B0..E6, и свёртка сводит их в одну частоту), вне — крайняя
+        return min((c for c in candidates if c[3] == closest_class), key=lambda c: abs(lf - c[2]))[0]
 
     def get_target_frequency_for_measured(self, note: str, measured_freq: float) -> float:
         """
@@ -48,12 +278,23 @@ class NoteDetector:
         if base <= 0:
             return 0.0
 
-        f = base
         # подгоняем по октаве к измеренной частоте
-        while f * 2.0 <= measured_freq:
-            f *= 2.0
-        while f / 2.0 >= measured_freq:
-            f /= 2.0
+        # (как "while f*2 <= m: f *= 2; while f/2 >= m: f /= 2", без циклов)
+        f = base
+        if f * 2.0 <= measured_freq:
+            k = max(1, math.floor(math.log2(measured_freq / f)))
+            if math.ldexp(f, k) > measured_freq:
+                k -= 1
+            if math.ldexp(f, k + 1) <= measured_freq:
+                k += 1
+            f = math.ldexp(f, k)
+        elif f / 2.0 >= measured_freq:
+            j = max(1, math.floor(math.log2(f / measured_freq)))
+            if math.ldexp(f, -j) < measured_freq:
+                j -= 1
+            if math.ldexp(f, -(j + 1)) >= measured_freq:
+                j += 1
+            f = math.ldexp(f, -j)
 
         # теперь f рядом, но бывает что соседняя октава ещё ближе
         cand = [f, f * 2.0, f / 2.0]
@@ -61,10 +302,15 @@ class NoteDetector:
         best = min(cand, key=lambda c: abs(measured_freq - c))
         return float(best)
 
-    def detect_full(self, freq):
+    def detect_full(self, freq, confidence=None):
         """
         Полная детекция для тюнера.
-        Возвращает dict: {"note": str, "cents": float, "confidence": float}
+        Возвращает dict: {"note": str, "cents": float, "confidence": float,
+                          "octave": int, "target": float}
+        octave — октава целевой частоты, target — частота ноты в октаве, ближайшей к freq;
+        note — класс ноты и эта октава (внутри таблицы — её запись, выше/ниже таблицы — например "E6").
+        confidence — уверенность анализатора (PitchResult.confidence);
+        без неё, как раньше, оцениваем по отклонению в cents.
         """
         note = self.detect(freq)
         if not note:
@@ -76,14 +322,106 @@ class NoteDetector:
 
         cents = 1200 * np.log2(float(freq) / float(target))
 
-        confidence = max(0.0, 1.0 - (abs(cents) / 50.0))
-        confidence = min(1.0, confidence)
+        if confidence is None:
+            confidence = max(0.0, 1.0 - (abs(cents) / 50.0))
+        confidence = min(1.0, max(0.0, float(confidence)))
+
+        octave = int(round(69 + 12 * (math.log2(target) - self._log2_a4))) // 12 - 1
+        note = f"{PITCH_CLASSES[parse_note(note)[0]]}{octave}"
+
+        return {"note": note, "cents": float(cents), "confidence": float(confidence),
+                "octave": octave, "target": float(target)}
+
+    def detect_batch(self, freqs, chunk_size=65536):
+        """
+        detect_full для целого массива частот за один векторный проход
+        (например, трек высоты из Analisador.analyze_file).
+        Результат совпадает с поэлементным detect_full: тот же выбор класса и записи (см. detect),
+        тот же допуск 10 Гц.
+        0, отрицательные и NaN — "ноты нет".
+
+        Возвращает dict массивов той же длины:
+          "index"  — номер ноты в note_names (-1 — нет ноты),
+          "octave" — октава целевой частоты (-1 — нет ноты),
+          "target" — целевая частота (0.0 — нет ноты),
+          "cents"  — отклонение в cents (NaN — нет ноты).
+        """
+        f = np.asarray(freqs, dtype=np.float64).ravel()
+        n = f.size
+        index = np.full(n, -1, dtype=np.int64)
+        octave = np.full(n, -1, dtype=np.int64)
+        target = np.zeros(n, dtype=np.float64)
+        cents = np.full(n, np.nan, dtype=np.float64)
+
+        # матрица (кадры x записи таблицы) — кусками, чтобы не раздувать память
+        for start in range(0, n, int(chunk_size)):
+            stop = min(n, start + int(chunk_size))
+            self._detect_batch_chunk(f[start:stop], index[start:stop], octave[start:stop],
+                                     target[start:stop], cents[start:stop])
+
+        return {"index": index, "octave": octave, "target": target, "cents": cents}
+
+    def _detect_batch_chunk(self, f, index, octave, target, cents):
+        valid = np.isfinite(f) & (f > 0)
+        if not np.any(valid):
+            return
+        pos = np.flatnonzero(valid)
+        fv = f[pos]
+        lf = np.log2(fv)
+
+        # как в detect: только записи соседних классов ближайшего полутона
+        pc = (np.round(12 * (lf - self._log2_a4)).astype(np.int64) + 9) % 12
+        cand = self._cand_index[pc]
+        v = self._cand_freqs[cand]
+        lv = self._cand_log2[cand]
+        lf = lf[:, None]
+        fc = fv[:, None]
+
+        # как в detect: класс — по записи, ближайшей после переноса в ближайшую октаву
+        # (фиктивная запись с inf даёт NaN и отсекается допуском)
+        with np.errstate(invalid="ignore"):
+            dist = lf - lv
+            k = np.nan_to_num(np.rint(dist), nan=0.0).astype(np.int64)
+            diff = np.abs(fc - np.ldexp(v, k))
+        diff[~(diff < 10)] = np.inf  # tolerance в Гц
+
+        col = np.argmin(diff, axis=1)  # argmin отдаёт первый минимум — как строгое "<" в detect
+        rows = np.arange(col.size)
+        found = np.isfinite(diff[rows, col])
+        if not np.any(found):
+            return
+
+        # имя — запись того же класса, ближайшая по log2
+        classes = self._cand_classes[cand]
+        same = classes == classes[rows, col][:, None]
+        col = np.argmin(np.where(same, np.abs(dist), np.inf), axis=1)
+        pos, fv, best = pos[found], fv[found], cand[rows, col][found]
+
+        # целевая частота: как get_target_frequency_for_measured
+        base = self._table_freqs[best]
+        lb = self._table_log2[best]
+        lm = np.log2(fv)
+        up = base * 2.0 <= fv
+        k = np.maximum(1, np.floor(lm - lb)).astype(np.int64)
+        k -= up & (np.ldexp(base, k) > fv)
+        k += up & (np.ldexp(base, k + 1) <= fv)
+        down = ~up & (base / 2.0 >= fv)
+        j = np.maximum(1, np.floor(lb - lm)).astype(np.int64)
+        j -= down & (np.ldexp(base, -j) < fv)
+        j += down & (np.ldexp(base, -(j + 1)) >= fv)
+        t = np.ldexp(base, np.where(up, k, np.where(down, -j, 0)))
+
+        cand = np.stack((t, t * 2.0, t / 2.0), axis=1)
+        t = cand[np.arange(t.size), np.argmin(np.abs(fv[:, None] - cand), axis=1)]
 
-        return {"note": note, "cents": float(cents), "confidence": float(confidence)}
+        index[pos] = best
+        target[pos] = t
+        cents[pos] = 1200 * np.log2(fv / t)
+        octave[pos] = np.floor_divide(np.round(69 + 12 * (np.log2(t) - self._log2_a4)).astype(np.int64), 12) - 1
 
-    def detect_for_game(self, freq):
+    def detect_for_game(self, freq, confidence=None):
         """
         Для игры используем тот же результат, что и для тюнера:
         ближайшая нота + cents.
         """
-        return self.detect_full(freq)
+        return self.detect_full(freq, confidence)
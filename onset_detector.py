@@ -0,0 +1,133 @@
+# onset_detector.py
+import numpy as np
+
+
+class OnsetDetector:
+    """
+    Детектор атак (онсетов) по спектральному потоку (spectral flux):
+    маленький фиксированный FFT (n_fft ~21 мс) каждые step сэмплов,
+    поток = сумма положительных приращений лог-спектра между соседними кадрами.
+
+    Порог адаптивный: медиана потока за последние ~threshold_seconds * ratio + delta,
+    но не ниже затухающего (полураспад mask_half_life) потока последней атаки — хвост атаки
+    не даёт второго срабатывания. Атака — локальный максимум потока выше порога
+    (решение запаздывает на один шаг step), не чаще одной на min_interval секунд. Позиция атаки уточняется по сигналу до сэмпла (_refine).
+
+    Читает кольцо захвата (CaptureRing) сам: process(ring, end) разбирает всё, что пришло
+    с прошлого вызова, поэтому шаг анализатора (hop) на разрешение по времени не влияет.
+    """
+
+    def __init__(self, sr, ratio=1.5, delta=0.1, min_interval=0.05, threshold_seconds=0.1,
+                 min_level=0.01, mask_half_life=0.03):
+        self.sr = int(sr)
+        # ~21 мс при 44.1/48 кГц, шаг — четверть окна (~5 мс)
+        self.n_fft = 512 if self.sr <= 24000 else (1024 if self.sr <= 50000 else 2048)
+        self.step = self.n_fft // 4
+        self.ratio = float(ratio)
+        self.delta = float(delta)
+        self.min_interval = int(float(min_interval) * self.sr)
+        self.min_level = float(min_level)
+        self.mask_half_life = float(mask_half_life) * self.sr
+
+        self._window = np.hanning(self.n_fft).astype(np.float32)
+        # ниже ~60 Гц — гул и дрейф, в поток не берём
+        self._k_lo = max(1, int(60.0 * self.n_fft / self.sr))
+        self._history_size = max(8, int(float(threshold_seconds) * self.sr / self.step))
+        self.reset()
+
+    def reset(self, pos=0):
+        """Начать с абсолютной позиции pos (новая запись, смена устройства)."""
+        self._pos = int(pos)
+        self._prev_log = None
+        # последние значения потока для медианы порога (первые ~0.1 с порог — почти delta)
+        self._flux_history = np.zeros(self._history_size, dtype=np.float64)
+        self._prev_flux = 0.0
+        # кадр на подъёме потока: (позиция конца кадра, поток, порог, уровень), ждёт спада
+        self._candidate = None
+        self._last_onset = -self.min_interval
+        self._last_flux = 0.0
+
+    def process(self, ring, end):
+        """
+        Новые кадры потока вплоть до позиции end. Возвращает список атак [(sample, strength)],
+        sample — абсолютная позиция первого сэмпла атаки, strength — поток / порог (> 1).
+        """
+        n, step = self.n_fft, self.step
+        if self._pos < n:
+            self._pos = n
+        # анализ отстал больше, чем держит кольцо — догоняем, не разбирая пропущенное
+        oldest = ring.written - ring.capacity + n
+        if self._pos - step < oldest:
+            self._pos = oldest + step
+            self._prev_log = None
+            self._candidate = None
+
+        count = (end - self._pos) // step + 1
+        if count <= 0:
+            return []
+
+        first = self._pos
+        last = first + (count - 1) * step
+        span = ring.view(last, last - first + n)
+        frames = np.lib.stride_tricks.sliding_window_view(span, n)[::step]
+        mags = np.abs(np.fft.rfft(frames * self._window, axis=1))[:, self._k_lo:]
+        logs = np.log1p(100.0 * mags)
+        levels = np.max(np.abs(frames[:, -step:]), axis=1).tolist()
+
+        # поток всех новых кадров разом: положительные приращения лог-спектра к предыдущему кадру
+        prev = logs[:1] if self._prev_log is None else self._prev_log[None, :]
+        fluxes = np.mean(np.maximum(np.diff(np.vstack((prev, logs)), axis=0), 0.0), axis=1)
+        self._prev_log = logs[-1]
+
+        # порог кадра i — по медиане history_size значений потока перед ним
+        history = np.concatenate((self._flux_history, fluxes))
+        windows = np.lib.stride_tricks.sliding_window_view(history, self._history_size)[:count]
+        thresholds = (self.ratio * np.median(windows, axis=1) + self.delta).tolist()
+        self._flux_history = history[-self._history_size:]
+        fluxes = fluxes.tolist()
+
+        onsets = []
+        for i in range(count):
+            pos = first + i * step
+            flux = fluxes[i]
+            threshold = thresholds[i]
+            if self._last_flux > 0:
+                threshold = max(threshold, self._last_flux * 0.5 ** ((pos - self._last_onset) / self.mask_half_life))
+            # поток пошёл вниз — кандидат был локальным максимумом
+            cand = self._candidate
+            if cand is not None and flux <= cand[1]:
+                self._candidate = None
+                c_pos, c_flux, c_threshold, c_level = cand
+                if (c_flux > c_threshold and c_level >= self.min_level
+                        and c_pos - self._last_onset >= self.min_interval):
+                    self._last_onset = c_pos
+                    self._last_flux = c_flux
+                    onsets.append((self._refine(ring, c_pos), c_flux / c_threshold))
+            if flux > self._prev_flux:
+                self._candidate = (pos, flux, threshold, levels[i])
+            self._prev_flux = flux
+
+        self._pos = first + count * step
+        return onsets
+
+    def _refine(self, ring, pos):
+        """
+        Сэмпл начала атаки в кадре, кончающемся на pos: там, где быстрее всего растёт
+        кратковременная энергия (скользящее окно 32 сэмпла), с откатом к началу подъёма.
+        Подъём начинается, когда атака входит в новое окно, — это его последний сэмпл.
+        """
+        n = self.n_fft
+        start = pos - n
+        x = np.asarray(ring.view(pos, n), dtype=np.float64)
+        w = 32
+        energy = np.convolve(x * x, np.ones(w), mode="valid")  # energy[i] — сэмплы i..i+w-1
+        if energy.size <= w:
+            return pos - self.step
+        rise = energy[w:] - energy[:-w]                        # rise[j] — сэмплы j+w..j+2w-1 против j..j+w-1
+        j = int(np.argmax(rise))
+        peak = float(rise[j])
+        if peak <= 0:
+            return pos - self.step
+        while j > 0 and rise[j - 1] > 0.1 * peak:
+            j -= 1
+        return start + j + 2 * w - 1
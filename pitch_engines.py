@@ -0,0 +1,271 @@
+# pitch_engines.py
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+def autocorrelation_terms(x, tau_max):
+    """
+    Общие слагаемые YIN и MPM для лагов 0..tau_max (сигнал без DC, float64):
+    r(tau) — автокорреляция одним FFT (с нулями, без "заворота"),
+    m(tau) = sum(x[j]^2, j < n-tau) + sum(x[j]^2, j >= tau) — энергия перекрывающихся частей.
+    Возвращает (r, m, taus).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    x = x - float(np.mean(x))  # DC remove
+    n = x.size
+    nfft = 1 << int(np.ceil(np.log2(n + tau_max + 1)))
+    spec = np.fft.rfft(x, nfft)
+    acf = np.fft.irfft(spec.real * spec.real + spec.imag * spec.imag, nfft)[:tau_max + 1]
+
+    energy = np.empty(n + 1, dtype=np.float64)
+    energy[0] = 0.0
+    np.cumsum(x * x, out=energy[1:])
+    taus = np.arange(tau_max + 1)
+    m = energy[n - taus] + (energy[n] - energy[taus])
+    return acf, m, taus
+
+
+class PitchEstimator(ABC):
+    """
+    Общий интерфейс движка определения высоты тона.
+    estimate() получает окно, частоту дискретизации и диапазон поиска,
+    возвращает (freq, confidence): confidence ~ 0..1, если ноты нет -> (0.0, 0.0).
+    spectrum — спектр кадра (FrameSpectrum), чтобы спектральные движки не считали FFT заново.
+
+    conf_min — пороги уверенности (ниже/выше split_high_hz) на шкале этого движка;
+    None — пороги анализатора conf_min_low/conf_min_high (шкала YIN).
+    """
+
+    name = ""
+    conf_min = None
+
+    @abstractmethod
+    def estimate(self, x, sr, fmin, fmax, spectrum=None):
+        """(freq, confidence) для окна x."""
+
+    @staticmethod
+    def _frame_spectrum(x, sr, spectrum):
+        if spectrum is not None:
+            return spectrum
+        from analisator import FrameSpectrum
+        return FrameSpectrum(np.asarray(x, dtype=np.float32), sr)
+
+    @staticmethod
+    def _harmonic_confidence(spec, freq, fmin, harmonics):
+        """Доля энергии спектра (выше fmin), попавшая в первые harmonics гармоник freq: 0..1."""
+        mags = spec.mags
+        step = float(spec.sr) / float(spec.n)
+        k_lo = max(1, int(np.ceil(fmin / step)))
+        power = mags * mags
+        total = float(np.sum(power[k_lo:])) + 1e-12
+
+        in_harm = 0.0
+        for h in range(1, int(harmonics) + 1):
+            b = int(round(h * freq / step))
+            if b + 1 >= mags.size:
+                break
+            in_harm += float(np.sum(power[max(0, b - 1):b + 2]))
+        return max(0.0, min(1.0, in_harm / total))
+
+
+class YinEstimator(PitchEstimator):
+    """YIN анализатора (CMNDF, см. Analisador._detect_pitch_yin)."""
+
+    name = "yin"
+
+    def __init__(self, detect):
+        self._detect = detect
+
+    def estimate(self, x, sr, fmin, fmax, spectrum=None):
+        return self._detect(x, sr, fmin, fmax)
+
+
+class McLeodEstimator(PitchEstimator):
+    """
+    McLeod Pitch Method: нормированная функция NSDF = 2 r(tau) / m(tau)
+    (r и m — те же, что в YIN, см. autocorrelation_terms), берём первый "ключевой" максимум,
+    который не ниже k * самого большого.
+    """
+
+    name = "mpm"
+
+    def __init__(self, k=0.9):
+        self.k = float(k)
+
+    def estimate(self, x, sr, fmin, fmax, spectrum=None):
+        n = np.size(x)
+        if n < 512:
+            return 0.0, 0.0
+
+        tau_min = max(1, int(sr / fmax))
+        tau_max = min(int(sr / fmin) + 1, n // 2)
+        if tau_max <= tau_min + 2:
+            return 0.0, 0.0
+
+        acf, m, _ = autocorrelation_terms(x, tau_max)
+
+        nsdf = np.zeros(tau_max + 1, dtype=np.float64)
+        ok = m > 1e-12
+        nsdf[ok] = 2.0 * acf[ok] / m[ok]
+
+        # ключевые максимумы: по одному на каждый положительный участок NSDF,
+        # участок у tau=0 (тривиальный максимум) пропускаем
+        pos = nsdf > 0
+        changes = np.flatnonzero(pos[1:] != pos[:-1]) + 1
+        starts = changes[pos[changes]]
+        if starts.size == 0:
+            return 0.0, 0.0
+
+        peaks = []
+        for start in starts:
+            after = changes[changes > start]
+            end = int(after[0]) if after.size else tau_max + 1
+            k = int(start) + int(np.argmax(nsdf[start:end]))
+            if tau_min <= k <= tau_max - 1:
+                peaks.append(k)
+        if not peaks:
+            return 0.0, 0.0
+
+        best = max(float(nsdf[k]) for k in peaks)
+        if best <= 0:
+            return 0.0, 0.0
+
+        tau = next(k for k in peaks if nsdf[k] >= self.k * best)
+
+        y0, y1, y2 = float(nsdf[tau - 1]), float(nsdf[tau]), float(nsdf[tau + 1])
+        denom = (y0 - 2.0 * y1 + y2)
+        better_tau = tau + 0.5 * (y0 - y2) / denom if abs(denom) > 1e-12 else float(tau)
+        if better_tau <= 0:
+            return 0.0, 0.0
+
+        freq = float(sr / better_tau)
+        if freq < fmin or freq > fmax:
+            return 0.0, 0.0
+
+        return freq, max(0.0, min(1.0, y1))
+
+
+class HarmonicProductEstimator(PitchEstimator):
+    """
+    Harmonic Product Spectrum: перемножаем спектр с его сжатыми в 2..R раз копиями,
+    гармоники складываются в пик на фундаменте. Частота уточняется по пику спектра кадра.
+    """
+
+    name = "hps"
+
+    # доля энергии в гармониках: у шума <= ~0.01, у щипка >= ~0.13
+    conf_min = (0.05, 0.05)
+
+    def __init__(self, harmonics=4):
+        self.harmonics = int(harmonics)
+
+    def estimate(self, x, sr, fmin, fmax, spectrum=None):
+        spec = self._frame_spectrum(x, sr, spectrum)
+        if spec.n < spec.MIN_SIZE:
+            return 0.0, 0.0
+
+        mags = spec.mags
+        step = float(sr) / float(spec.n)
+        size = mags.size // self.harmonics
+        k_lo = max(1, int(np.ceil(fmin / step)))
+        k_hi = min(size - 1, int(np.floor(fmax / step)))
+        if k_hi <= k_lo:
+            return 0.0, 0.0
+
+        # в логарифмах: произведение -> сумма, без переполнений
+        logm = np.log(mags + 1e-12)
+        hps = logm[:size].copy()
+        for r in range(2, self.harmonics + 1):
+            hps += logm[::r][:size]
+
+        k = k_lo + int(np.argmax(hps[k_lo:k_hi + 1]))
+
+        # типичная ошибка HPS — октава вверх: проверяем субгармонику
+        half = int(round(k / 2.0))
+        if half >= k_lo and mags[half] > 0.3 * mags[k]:
+            k = half
+
+        freq = spec.refine_near(k * step, 1.5 * step)
+        if freq <= 0:
+            freq = k * step
+        if freq < fmin or freq > fmax:
+            return 0.0, 0.0
+
+        # уверенность: доля энергии спектра, попавшая в гармоники найденного тона
+        return float(freq), self._harmonic_confidence(spec, freq, fmin, self.harmonics)
+
+
+class CepstrumEstimator(PitchEstimator):
+    """
+    Кепстральный метод: обратное FFT от логарифма спектра, период = положение пика
+    по "кефренси" в диапазоне [sr/fmax, sr/fmin].
+    Спектр снизу обрезается на floor_db от максимума: иначе шумовой пол
+    в логарифме забивает гармонический пик.
+    """
+
+    name = "cepstrum"
+
+    # доля энергии в гармониках, как у HPS: у шума <= ~0.01, у щипка >= ~0.15
+    conf_min = (0.05, 0.05)
+
+    def __init__(self, floor_db=-30.0, k=0.8):
+        self.floor = 10.0 ** (float(floor_db) / 20.0)
+        self.k = float(k)
+
+    def estimate(self, x, sr, fmin, fmax, spectrum=None):
+        spec = self._frame_spectrum(x, sr, spectrum)
+        n = spec.n
+        if n < spec.MIN_SIZE:
+            return 0.0, 0.0
+
+        mags = spec.mags
+        top = float(np.max(mags))
+        if top <= 0:
+            return 0.0, 0.0
+        ceps = np.fft.irfft(np.log(np.maximum(mags, top * self.floor)), n)
+
+        q_lo = max(2, int(sr / fmax))
+        q_hi = min(n // 2 - 1, int(sr / fmin) + 1)
+        if q_hi <= q_lo + 2:
+            return 0.0, 0.0
+
+        # первый локальный максимум не ниже k * самого большого (пики на 2q, 3q — "рамоники")
+        region = ceps[q_lo - 1:q_hi + 2]
+        inner = region[1:-1]
+        is_peak = (inner >= region[:-2]) & (inner >= region[2:])
+        best = float(np.max(inner))
+        if best <= 0:
+            return 0.0, 0.0
+        cand = np.flatnonzero(is_peak & (inner >= self.k * best))
+        q = q_lo + int(cand[0]) if cand.size else q_lo + int(np.argmax(inner))
+        peak = float(ceps[q])
+
+        y0, y2 = float(ceps[q - 1]), float(ceps[q + 1])
+        denom = (y0 - 2.0 * peak + y2)
+        better_q = q + 0.5 * (y0 - y2) / denom if abs(denom) > 1e-12 else float(q)
+
+        freq = float(sr / better_q)
+        if freq < fmin or freq > fmax:
+            return 0.0, 0.0
+
+        # уверенность: как у HPS — доля энергии в гармониках найденного тона
+        return freq, self._harmonic_confidence(spec, freq, fmin, 8)
+
+
+ENGINES = {
+    "yin": YinEstimator,
+    "mpm": McLeodEstimator,
+    "hps": HarmonicProductEstimator,
+    "cepstrum": CepstrumEstimator,
+}
+
+
+def create_estimator(name, yin_detect=None):
+    """Движок по имени. Для "yin" нужен детектор анализатора (yin_detect)."""
+    key = (name or "yin").lower()
+    if key not in ENGINES:
+        raise ValueError(f"Неизвестный движок: {name}")
+    if key == "yin":
+        return YinEstimator(yin_detect)
+    return ENGINES[key]()
@@ -0,0 +1,86 @@
+# pitch_signal.py
+import threading
+
+from PyQt5 import QtCore
+
+
+class PitchSignalBridge(QtCore.QObject):
+    """
+    Мост "поток анализа -> GUI": подписывается на Analisador.subscribe
+    и переотправляет результат в поток GUI сигналами
+    frequency_changed(float) и result_changed(PitchResult),
+    а события нот (Analisador.subscribe_events) — сигналом note_event(NoteEvent).
+
+    Значения коалесцируются: если GUI ещё не забрал прошлое значение,
+    новое просто его заменяет — в очереди событий Qt всегда не больше одного.
+    События нот не теряются: копятся до доставки и уходят все по порядку.
+    Задержка до экрана определяется шагом hop анализатора, а не фазой таймера.
+    """
+
+    frequency_changed = QtCore.pyqtSignal(float)
+    result_changed = QtCore.pyqtSignal(object)
+    note_event = QtCore.pyqtSignal(object)
+    _wake = QtCore.pyqtSignal()
+
+    def __init__(self, analyzer=None, parent=None):
+        super().__init__(parent)
+        self._analyzer = None
+        self._latest = None
+        self._has_result = False
+        self._events = []
+        self._pending = False
+        self._pending_lock = threading.Lock()
+        # QueuedConnection: слот выполнится в потоке, где живёт мост (GUI)
+        self._wake.connect(self._deliver, QtCore.Qt.QueuedConnection)
+        if analyzer is not None:
+            self.attach(analyzer)
+
+    def attach(self, analyzer):
+        """Подписаться на анализатор (от прежнего отписывается)."""
+        if analyzer is self._analyzer:
+            return
+        self.detach()
+        self._analyzer = analyzer
+        analyzer.subscribe(self._on_result)
+        if hasattr(analyzer, "subscribe_events"):
+            analyzer.subscribe_events(self._on_event)
+        self._on_result(analyzer.get_result())
+
+    def detach(self):
+        if self._analyzer is not None:
+            self._analyzer.unsubscribe(self._on_result)
+            if hasattr(self._analyzer, "unsubscribe_events"):
+                self._analyzer.unsubscribe_events(self._on_event)
+            self._analyzer = None
+
+    def _on_result(self, result):
+        # поток анализа: только запомнить и разбудить GUI
+        with self._pending_lock:
+            self._latest = result
+            self._has_result = True
+            if self._pending:
+                return
+            self._pending = True
+        self._wake.emit()
+
+    def _on_event(self, event):
+        with self._pending_lock:
+            self._events.append(event)
+            if self._pending:
+                return
+            self._pending = True
+        self._wake.emit()
+
+    def _deliver(self):
+        with self._pending_lock:
+            result = self._latest if self._has_result else None
+            events = self._events
+            self._events = []
+            self._has_result = False
+            self._pending = False
+        # сначала события (атака раньше кадра, который её подтвердил), потом последний результат
+        for event in events:
+            self.note_event.emit(event)
+        if result is not None:
+            self.frequency_changed.emit(result.frequency)
+            self.result_changed.emit(result)
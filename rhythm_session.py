@@ -0,0 +1,172 @@
+# rhythm_session.py
+import statistics
+
+
+def _pitch_class(note):
+    """'F#3' -> 'F#'"""
+    return str(note).rstrip("0123456789")
+
+
+class RhythmSession:
+    """
+    Ритм-режим: партия — ноты со временем (секунды от старта), игрок попадает в них атаками.
+
+    Атака (NoteEvent "on" анализатора) сверяется с партией по времени захвата звука
+    (NoteEvent.timestamp — момент атаки в записи с точностью до сэмпла, уже с поправкой на задержку входа),
+    а не по тому, когда событие дошло до UI: задержка анализа и опроса на оценку не влияет.
+    latency — поправка на всё остальное (вывод картинки/звука, привычка игрока), вычитается из времени атаки;
+    summary() подсказывает её по среднему смещению попаданий.
+
+    Все времена — в часах анализатора (Analisador.clock(): perf_counter в живом режиме, секунды записи офлайн).
+    """
+
+    # оценка попадания по |смещению| от доли (сек); шире последнего окна — промах
+    GRADES = (("perfect", 0.025), ("great", 0.05), ("good", 0.1))
+
+    # атака видна анализатору не сразу (кадр потока ~21 мс + шаг): промах засчитываем с этим запасом
+    SETTLE = 0.05
+
+    def __init__(self, detector, chart, latency=0.0, grades=None):
+        """
+        detector — NoteDetector (нота атаки по её частоте),
+        chart    — [(нота, время от старта в сек), ...], как GameWindow.generate_notes_for_level(..., with_timing=True),
+        latency  — сек; положительная — атаки в записи приходят позже доли, которую видит игрок.
+        """
+        self.detector = detector
+        self.chart = sorted(((str(note).strip(), float(t)) for note, t in chart), key=lambda item: item[1])
+        self.latency = float(latency)
+        self.grades = tuple(grades) if grades is not None else self.GRADES
+        self.window = max(limit for _, limit in self.grades)
+        self.reset()
+
+    def reset(self):
+        self._judged = [False] * len(self.chart)
+        # первая нота, окно которой ещё не закрылось (всё до неё уже оценено)
+        self._next = 0
+        self.records = []
+        self.wrong = 0   # атаки рядом с нотой, но не той высоты
+        self.extra = 0   # атаки вдали от нот партии
+        self.started = None
+        self.finished = None
+
+    def start(self, now):
+        """now — начало партии в часах анализатора (Analisador.clock())."""
+        self.reset()
+        self.started = float(now)
+        if not self.chart:
+            self.finished = self.started
+
+    @property
+    def is_active(self):
+        return self.started is not None and self.finished is None
+
+    @property
+    def is_finished(self):
+        return self.finished is not None
+
+    def song_time(self, now):
+        """Позиция в партии (сек) для момента now."""
+        return float(now) - self.started if self.started is not None else 0.0
+
+    def upcoming(self, now, count=1):
+        """Ближайшие ещё не оценённые ноты [(нота, через сколько сек), ...] — для подсказки в UI."""
+        t = self.song_time(now)
+        out = []
+        for i in range(self._next, len(self.chart)):
+            if not self._judged[i]:
+                note, at = self.chart[i]
+                out.append((note, at - t))
+                if len(out) >= count:
+                    break
+        return out
+
+    def judge(self, event):
+        """
+        Атака игрока (NoteEvent "on" или любой объект с timestamp и frequency).
+        Оценивается ближайшая по времени неоценённая нота в пределах окна; если высота не та —
+        нота ждёт дальше (ложная атака не съедает ноту). Возвращает запись (см. records) или None.
+        """
+        if not self.is_active or float(event.frequency) <= 0:
+            return None
+
+        t = float(event.timestamp) - self.latency - self.started
+        best = None
+        for i in range(self._next, len(self.chart)):
+            at = self.chart[i][1]
+            if at - t > self.window:
+                break
+            if self._judged[i] or t - at > self.window:
+                continue
+            if best is None or abs(t - at) < abs(t - self.chart[best][1]):
+                best = i
+
+        if best is None:
+            self.extra += 1
+            return None
+
+        data = self.detector.detect_for_game(float(event.frequency))
+        played = data["note"] if data else ""
+        note, at = self.chart[best]
+        if _pitch_class(played) != _pitch_class(note):
+            self.wrong += 1
+            return None
+
+        offset = t - at
+        grade = next(name for name, limit in self.grades if abs(offset) <= limit)
+        return self._record(best, grade, offset, played)
+
+    def expire(self, analyzed_time):
+        """
+        Промахи: ноты, окно которых закрылось к analyzed_time — времени последнего разобранного звука
+        (PitchResult.timestamp), а не к часам UI, иначе атака, ещё не дошедшая из анализа, стала бы промахом.
+        Возвращает новые записи-промахи.
+        """
+        if not self.is_active:
+            return []
+        t = self.song_time(analyzed_time) - self.latency - self.SETTLE
+        missed = []
+        for i in range(self._next, len(self.chart)):
+            if self.chart[i][1] + self.window >= t:
+                break
+            if not self._judged[i]:
+                missed.append(self._record(i, "miss", None, ""))
+        return missed
+
+    def _record(self, i, grade, offset, played):
+        note, at = self.chart[i]
+        self._judged[i] = True
+        while self._next < len(self.chart) and self._judged[self._next]:
+            self._next += 1
+        record = {"index": i, "note": note, "time": at, "grade": grade, "offset": offset, "played": played}
+        self.records.append(record)
+        if self._next >= len(self.chart):
+            self.finished = self.started + at
+        return record
+
+    def summary(self):
+        """
+        Итог: число оценок по grades и промахов, смещения попаданий (сек, + — поздно):
+        mean/median/stdev, early/late, и suggested_latency — latency, при которой медиана смещения была бы 0.
+        """
+        counts = {name: 0 for name, _ in self.grades}
+        counts["miss"] = 0
+        offsets = []
+        for record in self.records:
+            counts[record["grade"]] += 1
+            if record["offset"] is not None:
+                offsets.append(record["offset"])
+
+        median = statistics.median(offsets) if offsets else None
+        return {
+            "counts": counts,
+            "hits": len(offsets),
+            "notes": len(self.chart),
+            "wrong": self.wrong,
+            "extra": self.extra,
+            "early": sum(1 for o in offsets if o < 0),
+            "late": sum(1 for o in offsets if o > 0),
+            "mean_offset": statistics.fmean(offsets) if offsets else None,
+            "median_offset": median,
+            "stdev_offset": statistics.pstdev(offsets) if len(offsets) > 1 else None,
+            "suggested_latency": self.latency + median if len(offsets) >= 3 else None,
+        }
@@ -0,0 +1,130 @@
+# tuning_session.py
+import math
+import time
+
+
+class TuningSession:
+    """
+    Пошаговая настройка: струны строя по очереди (по умолчанию с 6-й до 1-й).
+    Струна считается настроенной ("lock"), когда стабилизированная частота анализатора
+    (PitchResult.frequency) держится в пределах lock_cents от цели не меньше hold_time секунд.
+    После этого сессия сама переходит к следующей струне.
+
+    Время берётся из PitchResult.timestamp (perf_counter в живом режиме, секунды от начала
+    записи — офлайн), поэтому время до lock не зависит от того, как часто обновляется UI.
+    """
+
+    def __init__(self, detector, strings, lock_cents=10.0, hold_time=0.5, order=None):
+        """
+        detector — NoteDetector (цели считаются при его A4 и строе),
+        strings  — ноты строя от 6-й (толстой) струны к 1-й, как в guitar_tunings,
+        order    — порядок обхода (индексы в strings), по умолчанию 0..5.
+        """
+        self.detector = detector
+        self.strings = [str(s).strip() for s in strings]
+        self.lock_cents = float(lock_cents)
+        self.hold_time = float(hold_time)
+        self.order = list(order) if order is not None else list(range(len(self.strings)))
+        self.reset()
+
+    def reset(self):
+        self._step = 0
+        self._targets = [self.detector.note_to_frequency(note) for note in self.strings]
+        self._string_started = None
+        self._in_band_since = None
+        self.records = []
+        self.started = None
+        self.finished = None
+
+    def start(self, now=None):
+        """now — в тех же часах, что PitchResult.timestamp (по умолчанию time.perf_counter)."""
+        self.reset()
+        self.started = time.perf_counter() if now is None else float(now)
+        self._string_started = self.started
+
+    @property
+    def is_active(self):
+        return self.started is not None and self.finished is None
+
+    @property
+    def is_finished(self):
+        return self.finished is not None
+
+    def current(self):
+        """(номер струны, нота, целевая частота) или None, если все струны настроены."""
+        if self._step >= len(self.order):
+            return None
+        i = self.order[self._step]
+        return len(self.strings) - i, self.strings[i], self._targets[i]
+
+    def update(self, result):
+        """
+        Очередной PitchResult анализатора. Возвращает состояние для UI:
+        {"string", "note", "target", "cents" (None — нет ноты), "in_band", "hold" 0..1,
+         "locked" — струна только что настроена, "finished" — настроены все}.
+        """
+        current = self.current()
+        if not self.is_active or current is None:
+            return None
+
+        number, note, target = current
+        now = float(result.timestamp)
+        freq = float(result.frequency)
+
+        cents = 1200.0 * math.log2(freq / target) if freq > 0 else None
+        in_band = cents is not None and abs(cents) <= self.lock_cents
+
+        if not in_band:
+            self._in_band_since = None
+        elif self._in_band_since is None and result.stable:
+            # удержание начинаем только с кадра, подтверждённого гистерезисом
+            self._in_band_since = now
+
+        held = 0.0 if self._in_band_since is None else now - self._in_band_since
+        locked = self._in_band_since is not None and held >= self.hold_time
+
+        state = {
+            "string": number,
+            "note": note,
+            "target": target,
+            "cents": cents,
+            "in_band": in_band,
+            "hold": 1.0 if locked else (min(1.0, held / self.hold_time) if self.hold_time > 0 else 0.0),
+            "locked": locked,
+            "finished": False,
+        }
+
+        if locked:
+            self.records.append({
+                "string": number,
+                "note": note,
+                "time_to_lock": now - self._string_started,
+                "cents": cents,
+            })
+            self._advance(now)
+            state["finished"] = self.is_finished
+
+        return state
+
+    def skip(self, now=None):
+        """Пропустить текущую струну (в records не попадает)."""
+        if self.is_active:
+            self._advance(time.perf_counter() if now is None else float(now))
+
+    def _advance(self, now):
+        self._step += 1
+        self._in_band_since = None
+        self._string_started = now
+        if self._step >= len(self.order):
+            self.finished = now
+
+    def summary(self):
+        """Время до lock по струнам и общее время настройки (сек)."""
+        total = None
+        if self.started is not None and self.finished is not None:
+            total = self.finished - self.started
+        return {
+            "strings": list(self.records),
+            "locked": len(self.records),
+            "total_time": total,
+        }
@@ -1,14 +1,19 @@
 from PyQt5 import QtCore, QtGui, QtWidgets
 
+from note_detecter import parse_note
+
 
 class TuningWindow(QtWidgets.QDialog):
-    def __init__(self, db_manager, user_id, parent=None):
+    def __init__(self, db_manager, user_id, parent=None, active_tuning=None):
         super().__init__(parent)
         self.db_manager = db_manager
         self.user_id = user_id
-        self.current_tuning = None
+        # active_tuning — строй, по которому сейчас работает тюнер (None — хроматический режим)
+        self.active_tuning = active_tuning
+        self.current_tuning = active_tuning
         self.setupUi()
         self.load_tunings()
+        self.show_current_tuning()
 
     def setupUi(self):
         self.setObjectName("TuningWindow")
@@ -210,6 +215,29 @@ class TuningWindow(QtWidgets.QDialog):
 
         buttons_layout = QtWidgets.QHBoxLayout()
 
+        # Тюнер без строя: ближайшая хроматическая нота
+        self.chromatic_btn = QtWidgets.QPushButton("Хроматический")
+        self.chromatic_btn.setStyleSheet("""
+            QPushButton {
+                color: rgb(0, 170, 0);
+                background-color: rgb(36, 36, 36);
+                font: 12pt "MS Serif";
+                border-width: 3px;
+                border-style: solid;
+                border-color: #00aa00;
+                padding: 8px;
+                min-width: 140px;
+            }
+            QPushButton:hover {
+                background-color: rgb(50, 50, 50);
+            }
+            QPushButton:pressed {
+                background-color: rgb(70, 70, 70);
+            }
+        """)
+        self.chromatic_btn.clicked.connect(self.select_chromatic)
+        buttons_layout.addWidget(self.chromatic_btn)
+
         self.delete_btn = QtWidgets.QPushButton("Удалить строй")
         self.delete_btn.setStyleSheet("""
             QPushButton {
@@ -272,6 +300,17 @@ class TuningWindow(QtWidgets.QDialog):
             item.setData(QtCore.Qt.UserRole, tuning)
             self.tunings_list.addItem(item)
 
+    @staticmethod
+    def invalid_notes(strings):
+        """Ноты, которые тюнер не разберёт (parse_note): 'Eb' без октавы, 'EB2' и т.п."""
+        bad = []
+        for note in strings:
+            try:
+                parse_note(note)
+            except ValueError:
+                bad.append(note)
+        return bad
+
     def on_tuning_selected(self, item):
         tuning_data = item.data(QtCore.Qt.UserRole)
         self.current_tuning = tuning_data
@@ -279,10 +318,42 @@ class TuningWindow(QtWidgets.QDialog):
         strings_text = " - ".join(tuning_data['strings'])
         self.tuning_display.setText(f"{tuning_data['name']}: {strings_text}")
 
+        # строй с неверными нотами (создан до проверки) можно только удалить
+        bad = self.invalid_notes(tuning_data['strings'])
+        if bad:
+            self.tuning_display.setText(f"{tuning_data['name']}: неверные ноты {', '.join(bad)}")
+            self.show_message(f"В строе \"{tuning_data['name']}\" неверные ноты: {', '.join(bad)}", "error")
+
         is_standard = tuning_data['name'] in ["Стандартный", "Drop D",
                                               "Open G", "Полутон ниже"]
         self.delete_btn.setEnabled(not is_standard)
 
+    def show_current_tuning(self):
+        """Подсветить строй, с которым открыли окно (активный строй тюнера)."""
+        if not self.current_tuning:
+            return
+        for row in range(self.tunings_list.count()):
+            item = self.tunings_list.item(row)
+            if item.data(QtCore.Qt.UserRole)['name'] == self.current_tuning['name']:
+                self.tunings_list.setCurrentItem(item)
+                self.on_tuning_selected(item)
+                return
+        # активного строя больше нет в базе
+        self.current_tuning = None
+
+    def select_chromatic(self):
+        self.current_tuning = None
+        self.tunings_list.clearSelection()
+        self.tuning_display.setText("Хроматический режим: ближайшая нота")
+        self.delete_btn.setEnabled(False)
+
+    def get_selected_tuning(self):
+        """Выбранный строй {'name', 'strings': [6 нот, от 6-й струны]} или None (хроматический режим)."""
+        if self.current_tuning and self.invalid_notes(self.current_tuning['strings']):
+            # неверный строй тюнеру не отдаём — остаётся тот, с которым открыли окно
+            return self.active_tuning
+        return self.current_tuning
+
     def create_tuning(self):
         tuning_name = self.tuning_name_edit.text().strip()
         if not tuning_name:
@@ -298,13 +369,19 @@ class TuningWindow(QtWidgets.QDialog):
 
         strings = []
         for edit in self.string_edits:
-            note = edit.text().strip().upper()
+            note = edit.text().strip()
             if note:
-                strings.append(note)
+                # заглавная только буква ноты: "eb2" -> "Eb2" (бемоль — строчная b)
+                strings.append(note[:1].upper() + note[1:])
             else:
                 self.show_message("Заполните все поля струн!", "error")
                 return
 
+        bad = self.invalid_notes(strings)
+        if bad:
+            self.show_message(f"Неверные ноты: {', '.join(bad)} (нота с октавой: E2, F#3, Bb1)", "error")
+            return
+
         if len(strings) != 6:
             self.show_message("Должно быть 6 струн!", "error")
             return